@@ -1,46 +1,171 @@
-import pickle, os, traceback, time
+import pickle, os, traceback, time, threading, atexit, heapq, itertools
+import concurrent.futures
 from .session_initialize import NEW_SESSIONS, NEW_SESSIONS_CRON, LOG_SESSION
+from .session_router import SessionRouter
 from .responses import *
 from .requests import Request
 from .paths import PATHS
-from .permissions import get_permissions
+from .permissions import has_permission
 
 ACTIVE_SESSIONS = os.path.join(PATHS['data'], 'active_sessions.data')
 HISTORY_DIR = PATHS['history']
 SAVE_HISTORY = True
+CHECKPOINT_INTERVAL = 60  # 常驻模式下保存活动Session表的间隔（秒）
+USER_LOCK_STRIPES = 64  # 用户锁的数量，按user_id分配
+CRON_WORKERS = 8  # 定时器并行处理订阅的线程数
+CRON_TASK_TIMEOUT = 50  # 定时器等待每个用户的订阅处理完成的最长时间（秒），需小于定时间隔
+
+# 载入时建立一次关键词索引，之后每条消息只创建关键词匹配的Session
+ROUTER = SessionRouter(NEW_SESSIONS)
+ROUTER_CRON = SessionRouter(NEW_SESSIONS_CRON + NEW_SESSIONS)
+
+
+# 活动Session表，可以保存到硬盘（filename为None时不保存）
+# 常驻模式下整个进程共用一个表，只在检查点和退出时保存
+class ActiveSessions:
+    def __init__(self, filename=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.filename = filename
+        self.checkpoint_interval = checkpoint_interval
+        self._sessions = {}  # (platform, user_id) -> 该用户的活动Session序列
+        self._expiry = []  # 按到期时间排列的堆，元素为(到期时间, 序号, Session)
+        self._counter = itertools.count()  # 到期时间相同时按加入顺序
+        self._lock = threading.RLock()  # 保护表本身
+        self._user_locks = [threading.RLock() for _ in range(USER_LOCK_STRIPES)]  # 同一用户的消息依次处理
+        self._dirty = False
+        self._last_checkpoint = time.time()
+        self.load()
+
+    # 载入硬盘里的活动Session，不做任何判断
+    def load(self):
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'rb') as f:
+                sessions = pickle.load(f)
+        except (FileNotFoundError, EOFError):
+            self.save()
+        else:
+            with self._lock:
+                for session in sessions:
+                    self.add(session)
+
+    # 把活动Session列表保存回硬盘中
+    def save(self):
+        if self.filename is None:
+            return
+        with self._lock:
+            sessions = [session for user_sessions in self._sessions.values() for session in user_sessions]
+            with open(self.filename, 'wb') as f:
+                pickle.dump(sessions, f)  # 仍保存为Session序列
+            self._dirty = False
+            self._last_checkpoint = time.time()
+
+    # 距上次保存超过间隔且有改动时才保存
+    def checkpoint(self):
+        if self._dirty and time.time() - self._last_checkpoint >= self.checkpoint_interval:
+            try:
+                self.save()
+            except RuntimeError:  # 其他线程正在修改Session，下次再保存
+                traceback.print_exc()
+
+    def user_lock(self, user_id):
+        return self._user_locks[hash(str(user_id)) % len(self._user_locks)]
+
+    @staticmethod
+    def _key(session):
+        return getattr(session, 'platform', None), session.user_id
+
+    @staticmethod
+    def _deadline(session):
+        return session._last_activity.timestamp() + session._max_delta
+
+    def _remove(self, session):
+        key = self._key(session)
+        user_sessions = self._sessions.get(key, [])
+        if session in user_sessions:
+            user_sessions.remove(session)
+        if not user_sessions:
+            self._sessions.pop(key, None)
+
+    # 删除到期的Session，只检查堆顶已到期的部分
+    def refresh(self):
+        now = time.time()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, _, session = heapq.heappop(self._expiry)
+                deadline = self._deadline(session)
+                # 到期前刷新过，按新的到期时间放回；is_active只比较delta.seconds，需同时检查新的到期时间
+                if session.is_active() and deadline > now:
+                    heapq.heappush(self._expiry, (deadline, next(self._counter), session))
+                else:
+                    self._remove(session)
+                    self._dirty = True
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.setdefault(self._key(session), []).append(session)
+            heapq.heappush(self._expiry, (self._deadline(session), next(self._counter), session))
+            self._dirty = True
+
+    # 返回某一用户的活动Session，顺便删除已停止的（到期前主动deactivate的）
+    def find(self, platform, user_id) -> list:
+        with self._lock:
+            # 旧版本保存的Session没有platform，按第一次找到它的Request的平台归类
+            legacy_sessions = self._sessions.pop((None, user_id), []) if platform is not None else []
+            for session in legacy_sessions:
+                session.platform = platform
+                self._sessions.setdefault((platform, user_id), []).append(session)
+            if legacy_sessions:
+                self._dirty = True
+            user_sessions = self._sessions.get((platform, user_id), [])
+            for session in [session for session in user_sessions if not session.is_active()]:
+                self._remove(session)
+            return list(self._sessions.get((platform, user_id), []))
+
+
+_RESIDENT_SESSIONS = None
+_RESIDENT_LOCK = threading.Lock()
+
+
+# 常驻模式的活动Session表，第一次使用时从硬盘载入，进程退出时保存
+def get_resident_sessions() -> ActiveSessions:
+    global _RESIDENT_SESSIONS
+    with _RESIDENT_LOCK:
+        if _RESIDENT_SESSIONS is None:
+            _RESIDENT_SESSIONS = ActiveSessions(filename=ACTIVE_SESSIONS)
+            atexit.register(_RESIDENT_SESSIONS.save)
+        return _RESIDENT_SESSIONS
 
 
 # 分拣中心，对于每个来自各聊天软件接口的Request，寻找活动的Session或创建合适的Session
 class Distributor:
-    def __init__(self):
-        self.active_sessions = []  # 初始化活动Session列表
+    def __init__(self, resident=False):
+        """
+        :param resident: 常驻模式，使用进程内共用的活动Session表，不再在每条消息前后读写硬盘
+        """
+        self.resident = resident
+        self.active_sessions = None  # 活动Session表
         self.current_session = None  # 暂存Session，用于和各聊天软件接口沟通
         self._load_sessions()  # 载入存在硬盘里的活动Session
         self._new_session = NEW_SESSIONS  # 创建新Session时的列表
+        self._router = ROUTER  # 新Session列表对应的关键词索引
         self._max_iterate = 10
 
-    # 载入硬盘里的活动Session，不做任何判断
     def _load_sessions(self):
-        try:
-            with open(ACTIVE_SESSIONS, 'rb') as f:
-                self.active_sessions = pickle.load(f)
-        except FileNotFoundError:
-            self._save_sessions()
-        except EOFError:
-            self._save_sessions()
+        if self.resident:
+            self.active_sessions = get_resident_sessions()
+        else:
+            self.active_sessions = ActiveSessions(filename=ACTIVE_SESSIONS)
 
-    # 把活动Session列表保存回硬盘中
     def _save_sessions(self):
-        with open(ACTIVE_SESSIONS, 'wb') as f:
-            pickle.dump(self.active_sessions, f)
+        if self.resident:
+            self.active_sessions.checkpoint()
+        else:
+            self.active_sessions.save()
 
     # 刷新活动Session表（检查）并保存
     def refresh_and_save(self, save=True):
-        new_list = []
-        for session in self.active_sessions:
-            if session.is_active():
-                new_list.append(session)
-        self.active_sessions = new_list
+        self.active_sessions.refresh()
         if save:
             self._save_sessions()
 
@@ -49,8 +174,8 @@ class Distributor:
         self.refresh_and_save(save=save)
         # 在活动Session表中检查，若有符合的（用户id相同并且Request合法），采用该Session的处理方法
         if not request.echo:
-            for session in self.active_sessions:
-                if request.user_id == session.user_id:
+            with self.active_sessions.user_lock(request.user_id):
+                for session in self.active_sessions.find(platform=request.platform, user_id=request.user_id):
                     if session.is_legal_request(request=request):
                         session.refresh()
                         self.current_session = session
@@ -61,8 +186,20 @@ class Distributor:
         # echo一般是预处理出现问题时返回报错使用的
         return False
 
-    # 处理任意Request，返回Response序列
+    # 处理任意Request，返回Response序列，同一用户的Request依次处理
+    # Session产生的Request（可能属于其他用户）在释放本用户的锁之后再处理，不同时持有两个用户的锁
     def handle(self, request, debug=True):
+        with self.active_sessions.user_lock(request.user_id):
+            results = self._handle(request=request, debug=debug)
+        responses = []
+        for r in results:
+            if isinstance(r, Request):
+                responses += self.handle(request=r, debug=debug)
+            else:
+                responses.append(r)
+        return responses
+
+    def _handle(self, request, debug=True):
         session = None
         if self.use_active(request=request):
             # 若在活动Session表中，采用该Session的处理方法
@@ -74,16 +211,28 @@ class Distributor:
             # 如果没有符合条件的活动Session，新建一个Session（Possibility最高者）
             self.current_session = None
             max_possibility = 0
-            for session_class_candidate in self._new_session:
-                session_candidate = session_class_candidate(user_id=request.user_id)
-                if session_candidate.is_legal_request(request=request):
+            session_spec = None
+            for spec in self._router.candidates(request=request):
+                if spec.declarative:  # 由类属性判断，不创建Session
+                    session_candidate = None
+                    if not spec.is_legal_request(request=request):
+                        continue
+                    possibility = spec.probability_to_call(request=request)
+                else:
+                    session_candidate = spec.session_class(user_id=request.user_id)
+                    if not session_candidate.is_legal_request(request=request):
+                        continue
                     possibility = session_candidate.probability_to_call(request=request)
-                    if possibility > max_possibility:
-                        session = session_candidate
-                        max_possibility = possibility
+                if possibility > max_possibility:
+                    session = session_candidate
+                    session_spec = spec
+                    max_possibility = possibility
             if max_possibility > 0:
+                if session is None:  # 只为选中的插件创建Session
+                    session = session_spec.session_class(user_id=request.user_id)
+                session.platform = request.platform
                 # 把新Session存入内存的表中，把Request交给新Session处理
-                self.active_sessions.append(session)
+                self.active_sessions.add(session)
                 self.current_session = session
                 if SAVE_HISTORY:
                     filename = os.path.join(HISTORY_DIR, f'{request.platform}_{session.session_type}_{time.time()}.txt')
@@ -99,23 +248,12 @@ class Distributor:
             responses = []
             try:
                 raw_results = make_list(session.handle(request=request))
-                for r in raw_results:
-                    if isinstance(r, Response):
-                        responses.append(r)
-                    elif isinstance(r, Request):  # iterate handling requests
-                        self._max_iterate -= 1
-                        if self._max_iterate <= 0:
-                            pass
-                        else:
-                            responses += self.handle(request=r, debug=debug)
+                responses += self._handle_results(raw_results=raw_results, debug=debug)
             except:
                 session.deactivate()
                 if debug:
                     debug_info = traceback.format_exc()
-                    debug_user_list = get_permissions().get('debug', {}).get(request.platform)
-                    if debug_user_list is None:
-                        responses.append(ResponseMsg('【MultiBot】报错'))
-                    elif debug_user_list == [] or str(request.user_id) in debug_user_list:
+                    if has_permission('debug', request.platform, request.user_id):
                         # 如果debug，将错误信息返回
                         responses.append(ResponseMsg(debug_info))
                     else:
@@ -123,9 +261,10 @@ class Distributor:
                     # turn to LogSession
                     new_session = LOG_SESSION(user_id=request.user_id)
                     new_session.log = session.log  # pass log to new_session
+                    new_session.platform = request.platform
                     session = new_session
                     session.log.append(debug_info)
-                    self.active_sessions.append(session)
+                    self.active_sessions.add(session)
                     self.current_session = session  # 似乎可以不用
                     responses.append(ResponseMsg('【MultiBot】检测到后台出错，是否上报聊天记录和错误信息？(y/是/好)'))
             finally:
@@ -138,26 +277,103 @@ class Distributor:
         else:  # 若没有active session，且Possibility均为0，不返回Response
             return []
 
+    # 整理Session返回的结果，其中的Request保留在原位置，由handle在释放用户锁后依次处理
+    def _handle_results(self, raw_results, debug=True):
+        responses = []
+        for r in raw_results:
+            if isinstance(r, Response):
+                responses.append(r)
+            elif isinstance(r, Request):  # iterate handling requests
+                self._max_iterate -= 1
+                if self._max_iterate <= 0:
+                    pass
+                else:
+                    responses.append(r)
+        return responses
+
     # 在原Session中继续处理output，返回后续的Response序列
     def process_output(self, output):
         assert self.current_session is not None
-        self.current_session.refresh()
-        return make_list(self.current_session.process_output(output=output))
+        with self.active_sessions.user_lock(self.current_session.user_id):
+            self.current_session.refresh()
+            return make_list(self.current_session.process_output(output=output))
+
+
+_CRON_EXECUTOR = None
+_CRON_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_cron_executor():
+    global _CRON_EXECUTOR
+    with _CRON_EXECUTOR_LOCK:
+        if _CRON_EXECUTOR is None:
+            _CRON_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=CRON_WORKERS,
+                                                                   thread_name_prefix='MultiBotCron')
+        return _CRON_EXECUTOR
 
 
 # 定时器的分拣中心，接收来自定时器的Request
+# 订阅产生的Request按用户分组交给线程池并行处理，同一用户的依次处理
 class DistributorCron(Distributor):
-    def __init__(self):
+    def __init__(self, parallel=True, active_sessions=None):
+        """
+        :param parallel: 是否并行处理Session产生的Request，处理订阅的子分拣中心为False
+        :param active_sessions: 与父分拣中心共用的活动Session表
+        """
+        self._shared_sessions = active_sessions
         Distributor.__init__(self)
         self._new_session = NEW_SESSIONS_CRON + NEW_SESSIONS  # 定时器专属的新Session列表
-        self._max_iterate = 50  # 可能会多次重复调用
+        self._router = ROUTER_CRON
+        self._max_iterate = 50  # 可能会多次重复调用，每个订阅单独计数
+        self._parallel = parallel
 
     def _load_sessions(self):
-        pass
+        if self._shared_sessions is not None:
+            self.active_sessions = self._shared_sessions
+        else:
+            self.active_sessions = ActiveSessions(filename=None)  # 不保存到硬盘
 
     def _save_sessions(self):
         pass
 
+    # 定时器的Request只来自调度线程，不需要用户锁，也避免子分拣中心等待同一把锁
+    def handle(self, request, debug=True):
+        if self._parallel:
+            return self._handle(request=request, debug=debug)
+        return Distributor.handle(self, request=request, debug=debug)
+
+    def _handle_results(self, raw_results, debug=True):
+        if not self._parallel:
+            return Distributor._handle_results(self, raw_results=raw_results, debug=debug)
+        responses = []
+        user_requests = {}  # user_id -> 该用户的Request序列
+        for r in raw_results:
+            if isinstance(r, Response):
+                responses.append(r)
+            elif isinstance(r, Request):
+                user_requests.setdefault(r.user_id, []).append(r)
+
+        executor = get_cron_executor()
+        futures = {user_id: executor.submit(self._handle_user_requests, requests=requests, debug=debug)
+                   for user_id, requests in user_requests.items()}
+        deadline = time.time() + CRON_TASK_TIMEOUT
+        for user_id, future in futures.items():
+            try:
+                responses += future.result(timeout=max(deadline - time.time(), 0))
+            except concurrent.futures.TimeoutError:  # 线程无法中止，放弃这一结果
+                print(f'【MultiBot】定时任务超时：user_id={user_id}')
+            except:
+                traceback.print_exc()
+        return responses
+
+    # 在线程池中运行，每个订阅由单独的子分拣中心处理（单独计算迭代次数）
+    def _handle_user_requests(self, requests, debug=True):
+        responses = []
+        for r in requests:
+            child = DistributorCron(parallel=False, active_sessions=self.active_sessions)
+            responses += child.handle(request=r, debug=debug)
+        return responses
+
 
 # 把原始response转化为序列
 def make_list(raw_response):
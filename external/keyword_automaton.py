@@ -0,0 +1,83 @@
+# 多关键词子串匹配（Aho–Corasick自动机），用于插件路由等需要一次扫描匹配大量关键词的场合
+from collections import deque
+import threading
+
+
+class KeywordAutomaton:
+    def __init__(self, keywords=None):
+        """
+        :param keywords: 可迭代的 (keyword, value) 对，或只有keyword（此时value为keyword本身）
+        """
+        self._goto = [{}]  # 每个状态的转移表
+        self._fail = [0]  # 失配指针
+        self._keyword_output = [[]]  # 以该状态结尾的关键词value
+        self._output = [[]]  # 每个状态匹配成功的value序列（包含失配链上的）
+        self._compiled = True
+        self._compile_lock = threading.Lock()
+        self.size = 0
+        if keywords is not None:
+            for item in keywords:
+                if isinstance(item, tuple):
+                    self.add(*item)
+                else:
+                    self.add(item)
+
+    def add(self, keyword: str, value=None):
+        if not keyword:  # 空关键词会匹配任意消息，不加入
+            return
+        if value is None:
+            value = keyword
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._keyword_output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._keyword_output[state].append(value)
+        self._compiled = False
+        self.size += 1
+
+    # 广度优先构建失配指针，在add之后、第一次查询之前自动调用
+    # 在新的表中构建完成后再一起替换，正在查询的线程不会读到构建了一半的表
+    def compile(self):
+        with self._compile_lock:
+            output = [list(values) for values in self._keyword_output]
+            fail_table = [0] * len(self._goto)
+            queue = deque(self._goto[0].values())
+            while queue:
+                state = queue.popleft()
+                for char, next_state in self._goto[state].items():
+                    queue.append(next_state)
+                    fail = fail_table[state]
+                    while fail and char not in self._goto[fail]:
+                        fail = fail_table[fail]
+                    fail_next = self._goto[fail].get(char, 0)
+                    fail_table[next_state] = fail_next if fail_next != next_state else 0
+                    output[next_state] = output[next_state] + output[fail_table[next_state]]
+            self._fail, self._output = fail_table, output
+            self._compiled = True
+
+    # 返回text中出现的所有关键词对应的value（按首次出现顺序，不重复），value需可哈希
+    def search(self, text: str) -> list:
+        if not self._compiled:
+            self.compile()
+        goto, fail_table, output = self._goto, self._fail, self._output
+        results = []
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail_table[state]
+            state = goto[state].get(char, 0)
+            for value in output[state]:
+                if value not in found:
+                    found.add(value)
+                    results.append(value)
+        return results
+
+    def __len__(self):
+        return self.size
@@ -1,38 +1,54 @@
 # created in 20220427
+# 存储方式可替换：默认SQLite（按行增删改，string_cols建索引），Excel只用于导入导出和需要手动编辑的表
 import pandas as pd
-import os
+import os, json, sqlite3
+
+DEFAULT_BACKEND = 'sqlite'
+_READY_DBS = set()  # 本进程中已检查过表结构的数据库
 
 
 class RecordNotFoundError(Exception):
     pass
 
 
-class RecordTable:
-    def __init__(self, table_file, string_cols=None):
-        if string_cols is None:
-            string_cols = []
+# 文件的(修改时间, 大小)，用于判断是否被改写，文件不存在时为None
+def _file_stat(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# pandas读出的numpy数值转为python内置类型，便于JSON保存和比较
+def _to_builtin(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+# 旧的存储方式：每次读写整个Excel表格，适合需要手动编辑的小表（如权限表）
+class ExcelBackend:
+    def __init__(self, table_file, string_cols):
         self.table_file = table_file
-        self._current_records = []  # current records that are viewed
-        self._string_cols = string_cols  # 转化为string的列
+        self._string_cols = string_cols
 
-    def is_exist(self):
+    def exists(self):
         return os.path.exists(self.table_file)
 
+    def stat(self):
+        return _file_stat(self.table_file)
+
     def get_dfl(self) -> list:
-        if os.path.exists(self.table_file):
-            df = pd.read_excel(self.table_file)
-            for col in self._string_cols:
-                df[col] = df[col].astype(str)
-            return df.to_dict('records')
-        else:
-            # 新建表格
+        if not self.exists():
             return []
+        df = pd.read_excel(self.table_file)
+        for col in self._string_cols:
+            df[col] = df[col].astype(str)
+        return df.to_dict('records')
 
     def find_all(self, **kwargs) -> list:
-        for k in kwargs.keys():
-            if k not in self._string_cols:
-                raise KeyError('仅支持string')
-        if not self.is_exist():
+        if not self.exists():
             return []
         df = pd.read_excel(self.table_file)
         for col in self._string_cols:
@@ -42,35 +58,271 @@ class RecordTable:
                 df = df[df[k].astype(str) == str(v)]  # filter
         return df.to_dict('records')
 
-    def append_full(self, item: dict):
-        # 读取原数据
-        dfl = self.get_dfl()
-        dfl.append(item)
-        # 保存数据
+    def _write(self, dfl):
         pd.DataFrame(dfl).to_excel(self.table_file, index=False)
 
-    # 删除一条记录
+    def append(self, items: list):
+        self._write(self.get_dfl() + list(items))
+
     def delete(self, record, from_new=True):
         dfl = self.get_dfl()
-        if from_new:
-            dfl = dfl[::-1]
-        for i, r in enumerate(dfl):  # from new
-            if r == record:
-                dfl = dfl[:i] + dfl[i+1:]
-                pd.DataFrame(dfl).to_excel(self.table_file, index=False)
+        indices = range(len(dfl) - 1, -1, -1) if from_new else range(len(dfl))
+        for i in indices:
+            if dfl[i] == record:
+                self._write(dfl[:i] + dfl[i+1:])
                 return
         raise RecordNotFoundError
 
-    # 替换一条记录
+    def delete_all(self, records: list, from_new=True) -> int:
+        dfl = self.get_dfl()
+        removed = set()
+        indices = range(len(dfl) - 1, -1, -1) if from_new else range(len(dfl))
+        for record in records:
+            for i in indices:
+                if i not in removed and dfl[i] == record:
+                    removed.add(i)
+                    break
+        if removed:
+            self._write([r for i, r in enumerate(dfl) if i not in removed])
+        return len(removed)
+
     def replace(self, record_old, record_new):
         dfl = self.get_dfl()
         for i, r in enumerate(dfl):
             if r == record_old:
-                dfl = dfl[:i] + [record_new] + dfl[i+1:]
-                pd.DataFrame(dfl).to_excel(self.table_file, index=False)
+                self._write(dfl[:i] + [record_new] + dfl[i+1:])
                 return
         raise RecordNotFoundError
 
+
+# SQLite存储：每条记录一行（JSON），string_cols另存为带索引的列，增删改只涉及相关的行
+# 数据库不存在而同名Excel表格存在时，第一次使用时自动导入
+class SqliteBackend:
+    def __init__(self, table_file, string_cols):
+        self.table_file = table_file  # Excel表格，只用于导入导出
+        self.db_file = os.path.splitext(table_file)[0] + '.sqlite3'
+        self._string_cols = string_cols
+
+    def exists(self):
+        return os.path.exists(self.db_file) or os.path.exists(self.table_file)
+
+    def stat(self):
+        return _file_stat(self.db_file) or _file_stat(self.table_file)
+
+    def _connect(self):
+        new_db = not os.path.exists(self.db_file)
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        if self.db_file not in _READY_DBS:
+            self._init_db(conn, new_db=new_db)
+            _READY_DBS.add(self.db_file)
+        return conn
+
+    def _init_db(self, conn, new_db=False):
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)')
+            existing_cols = [row[1] for row in conn.execute('PRAGMA table_info(records)')]
+            for col in self._string_cols:
+                if col not in existing_cols:  # 新增的string列，从已有记录中补全
+                    conn.execute(f'ALTER TABLE records ADD COLUMN "{col}" TEXT')
+                    for row_id, data in conn.execute('SELECT id, data FROM records').fetchall():
+                        conn.execute(f'UPDATE records SET "{col}" = ? WHERE id = ?',
+                                     (self._col_value(json.loads(data), col), row_id))
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{col}" ON records ("{col}")')
+        if new_db and os.path.exists(self.table_file):  # 只在新建数据库时导入旧表格
+            self.import_excel(self.table_file, conn=conn)
+
+    @staticmethod
+    def _col_value(record, col):
+        value = record.get(col)
+        return None if value is None else str(value)
+
+    # 与Excel方式一致，string_cols中的值转为字符串
+    def _normalize(self, record: dict) -> dict:
+        record = json.loads(json.dumps(record, default=_to_builtin))
+        for col in self._string_cols:
+            if col in record:
+                record[col] = str(record[col])
+        return record
+
+    def _row(self, record):
+        return [json.dumps(record, ensure_ascii=False)] + [self._col_value(record, col) for col in self._string_cols]
+
+    def _insert(self, conn, items):
+        cols = ''.join(f', "{col}"' for col in self._string_cols)
+        marks = ', ?' * len(self._string_cols)
+        conn.executemany(f'INSERT INTO records (data{cols}) VALUES (?{marks})',
+                         [self._row(self._normalize(item)) for item in items])
+
+    def _select(self, conn, conditions: dict, from_new=False):
+        sql = 'SELECT id, data FROM records'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(f'"{k}" = ?' for k in conditions.keys())
+        sql += ' ORDER BY id DESC' if from_new else ' ORDER BY id'
+        for row_id, data in conn.execute(sql, [str(v) for v in conditions.values()]):
+            yield row_id, json.loads(data)
+
+    # 用string列缩小范围后再逐条比较
+    def _find_id(self, conn, record, from_new=False, exclude=()):
+        record = self._normalize(record)
+        conditions = {col: record[col] for col in self._string_cols if col in record}
+        for row_id, r in self._select(conn, conditions, from_new=from_new):
+            if r == record and row_id not in exclude:
+                return row_id
+        raise RecordNotFoundError
+
+    def get_dfl(self) -> list:
+        return self.find_all()
+
+    def find_all(self, **kwargs) -> list:
+        if not self.exists():
+            return []
+        conn = self._connect()
+        try:
+            conditions = {k: v for k, v in kwargs.items() if v is not None}
+            return [r for _, r in self._select(conn, conditions)]
+        finally:
+            conn.close()
+
+    def append(self, items: list):
+        conn = self._connect()
+        try:
+            with conn:
+                self._insert(conn, items)
+        finally:
+            conn.close()
+
+    def delete(self, record, from_new=True):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM records WHERE id = ?', (self._find_id(conn, record, from_new=from_new),))
+        finally:
+            conn.close()
+
+    # 在一个事务中删除多条记录，忽略找不到的，返回删除的条数
+    def delete_all(self, records: list, from_new=True) -> int:
+        conn = self._connect()
+        try:
+            with conn:
+                row_ids = set()
+                for record in records:
+                    try:
+                        row_ids.add(self._find_id(conn, record, from_new=from_new, exclude=row_ids))
+                    except RecordNotFoundError:
+                        pass
+                conn.executemany('DELETE FROM records WHERE id = ?', [(row_id,) for row_id in row_ids])
+                return len(row_ids)
+        finally:
+            conn.close()
+
+    def replace(self, record_old, record_new):
+        conn = self._connect()
+        try:
+            with conn:
+                row_id = self._find_id(conn, record_old)
+                cols = ''.join(f', "{col}" = ?' for col in self._string_cols)
+                conn.execute(f'UPDATE records SET data = ?{cols} WHERE id = ?',
+                             self._row(self._normalize(record_new)) + [row_id])
+        finally:
+            conn.close()
+
+    # 从Excel表格导入（追加到已有记录之后）
+    def import_excel(self, filename, conn=None):
+        df = pd.read_excel(filename)
+        df = df.astype(object).where(df.notna(), None)  # 空格子记为None
+        items = df.to_dict('records')
+        if conn is None:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._insert(conn, items)
+            finally:
+                conn.close()
+        else:
+            with conn:
+                self._insert(conn, items)
+        return len(items)
+
+
+BACKENDS = {'excel': ExcelBackend, 'sqlite': SqliteBackend}
+
+
+class RecordTable:
+    def __init__(self, table_file, string_cols=None, backend=None):
+        """
+        :param table_file: Excel表格路径，SQLite方式下只用于导入导出，数据库在同目录下同名的.sqlite3文件
+        :param backend: 'sqlite'或'excel'，默认为DEFAULT_BACKEND
+        """
+        if string_cols is None:
+            string_cols = []
+        if backend is None:
+            backend = DEFAULT_BACKEND
+        self.table_file = table_file
+        self._current_records = []  # current records that are viewed
+        self._string_cols = string_cols  # 转化为string的列
+        self._backend = BACKENDS[backend](table_file=table_file, string_cols=string_cols)
+
+    def is_exist(self):
+        return self._backend.exists()
+
+    # 存储文件的(修改时间, 大小)，可用于判断其他进程是否改写了表格
+    def stat(self):
+        return self._backend.stat()
+
+    # 每次写入后调用，子类可以在这里更新缓存
+    def _changed(self):
+        pass
+
+    def get_dfl(self) -> list:
+        return self._backend.get_dfl()
+
+    def find_all(self, **kwargs) -> list:
+        for k in kwargs.keys():
+            if k not in self._string_cols:
+                raise KeyError('仅支持string')
+        return self._backend.find_all(**kwargs)
+
+    def append_full(self, item: dict):
+        self._backend.append([item])
+        self._changed()
+
+    # 一次写入多条记录
+    def append_all(self, items: list):
+        if items:
+            self._backend.append(items)
+            self._changed()
+
+    # 删除一条记录
+    def delete(self, record, from_new=True):
+        self._backend.delete(record=record, from_new=from_new)
+        self._changed()
+
+    # 一次删除多条记录，忽略找不到的，返回删除的条数
+    def delete_all(self, records: list, from_new=True) -> int:
+        if not records:
+            return 0
+        n_deleted = self._backend.delete_all(records=records, from_new=from_new)
+        self._changed()
+        return n_deleted
+
+    # 替换一条记录
+    def replace(self, record_old, record_new):
+        self._backend.replace(record_old=record_old, record_new=record_new)
+        self._changed()
+
+    # 从Excel表格导入，追加到已有记录之后
+    def import_excel(self, filename):
+        df = pd.read_excel(filename)
+        df = df.astype(object).where(df.notna(), None)
+        self.append_all(df.to_dict('records'))
+
+    # 导出为Excel表格，默认导出到table_file
+    def export_excel(self, filename=None):
+        if filename is None:
+            filename = self.table_file
+        pd.DataFrame(self.get_dfl()).to_excel(filename, index=False)
+        return filename
+
     @staticmethod
     def list_single_record(record) -> str:
         return str(record)
@@ -91,4 +343,3 @@ class RecordTable:
             raise IndexError('超出范围')
         self.delete(record=self._current_records[i_del], from_new=from_new)
         return self._current_records[i_del]
-
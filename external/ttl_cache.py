@@ -0,0 +1,88 @@
+# 进程内共用的缓存：带过期时间（TTL）和最近最少使用（LRU）淘汰，同一key的并发读取只请求一次
+import threading, time
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    def __init__(self, max_size=256, ttl=600):
+        """
+        :param max_size: 最多保存的条目数，超出时淘汰最久未使用的
+        :param ttl: 默认的过期时间（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, value)
+        self._flights = {}  # key -> 正在进行的读取
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        if item[0] <= time.time():  # 已过期
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def get_or_load(self, key, loader, ttl=None, should_cache=None):
+        """
+        :param loader: 无参数的函数，缓存中没有时调用
+        :param should_cache: 判断loader的结果是否可以缓存（如请求失败的结果），默认全部缓存
+        """
+        missing = object()
+        with self._lock:
+            value = self._get(key, missing)
+            if value is not missing:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:  # 其他线程正在读取，等待其结果
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            if should_cache is None or should_cache(flight.value):
+                self.set(key, flight.value, ttl=ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def __len__(self):
+        return len(self._data)
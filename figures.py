@@ -0,0 +1,255 @@
+# 各插件的画图函数，在画图进程中执行（见render_service、render_worker）
+# 画图进程直接按文件载入本模块，不导入MultiBot包，因此这里只能导入numpy等第三方库，不能相对导入
+# 画图函数形如draw(fig, **kwargs)，只在传入的matplotlib Figure上作图
+import numpy as np
+import math
+
+
+# 账本（account_book）
+def draw_pie(fig, amounts, labels):
+    ax = fig.subplots()
+    ax.pie(amounts, labels=labels, autopct='%3.1f%%')
+    fig.tight_layout()
+
+
+def draw_curves(fig, xx, lines, xticklabels):
+    ax = fig.subplots()
+    for line_type, y in lines.items():
+        ax.plot(xx, y, label=line_type)
+    ax.legend()
+    ax.grid()
+    ax.set(xticks=xx, xticklabels=xticklabels)
+    fig.tight_layout()
+
+
+# 专注方块（popular）
+def draw_focus_cube(fig, xx, yy, v):
+    ax = fig.subplots(1, 1)
+    plt_kwargs = {'horizontalalignment': 'center',
+                  'verticalalignment': 'center'}
+
+    i = 0
+    for x in xx + 0.5:
+        for y in yy + 0.5:
+            ax.text(x, y, v[i], **plt_kwargs)
+            i += 1
+
+    ax.set(xlim=(0, len(xx)), ylim=(0, len(yy)),
+           xticks=xx, xticklabels=[],
+           yticks=yy, yticklabels=[])
+    ax.grid()
+    fig.tight_layout()
+
+
+# 宇宙学（cosmology）
+# lines: [(x, y, plot参数)]，vlines: [(x, ymin, ymax)]
+def draw_lines(fig, lines, ax_set, vlines=(), legend=True):
+    ax = fig.subplots()
+    for x, y, plot_kwargs in lines:
+        ax.plot(x, y, **plot_kwargs)
+    for x, ymin, ymax in vlines:
+        ax.vlines(x, ymin, ymax, linestyles='--')
+    ax.set(**ax_set)
+    if legend:
+        ax.legend()
+    ax.grid()
+    fig.tight_layout()
+
+
+# 天体高度（astropy），角度单位为度
+def draw_altitude(fig, star_name, hours, sun_alt, moon_alt, source_alt, source_az):
+    ax = fig.subplots()
+    ax.plot(hours, sun_alt, color='r', label='Sun')
+    ax.plot(hours, moon_alt, color=[0.75]*3, ls='--', label='Moon')
+    sc = ax.scatter(hours, source_alt,
+                    c=source_az, label=star_name, lw=0, s=8,
+                    cmap='viridis')
+    ax.fill_between(hours, 0, 90,
+                    sun_alt < -0, color='0.5', zorder=0)
+    ax.fill_between(hours, 0, 90,
+                    sun_alt < -18, color='k', zorder=0)
+    fig.colorbar(sc, ax=ax).set_label('Azimuth [deg]')
+    ax.legend(loc='upper left')
+    ax.set_xlim(-12, 12)
+    ax.set_xticks(np.arange(13)*2-12)
+    ax.set_ylim(0, 90)
+    ax.set_xlabel('Hours from EDT Midnight')
+    ax.set_ylabel('Altitude [deg]')
+
+
+def draw_polar(fig, star_name, source_az, source_zenith, moon_az, moon_zenith):
+    ax = fig.add_subplot(111, projection='polar')
+    # projection = 'polar' 指定为极坐标
+    ax.set_rlim(0, 90)
+    ax.plot()
+
+    ax.plot(source_az, source_zenith, label=star_name)
+    ax.plot(moon_az, moon_zenith,
+            color=[0.75]*3, ls='--', label='Moon')
+
+    ax.grid(True)  # 是否有网格
+    ax.legend()
+
+
+# 天气（weather）
+def next_day_plotter(ax, data_dict, label: str, plot_kwargs={}):
+    ln = ax.plot(data_dict['hour'], data_dict['value'], label=label, **plot_kwargs)
+    ax.set_xlim(min(data_dict['hour']), max(data_dict['hour']))
+    return ln
+
+
+def wind_plotter(ax, data_dict):
+    t = np.array(data_dict['hour'])
+    s = np.array(data_dict['speed'])
+    d = np.array(data_dict['direction']) * math.pi / 180
+    u = -s * np.sin(d) / 1.852
+    v = -s * np.cos(d) / 1.852
+    ax.plot(t, s / 3.6)
+    ax.barbs(t, s / 3.6, u, v, pivot='middle')
+
+
+def draw_temperature(fig, hour_list, temp_list, date):
+    ax = fig.subplots()
+    ax.plot(hour_list, temp_list)
+    ax.set_xlabel('Hour')
+    ax.set_ylabel('Temperature[℃]')
+    ax.set_title('Hourly Temperature [%s]' % date)
+    ax.grid()
+    fig.tight_layout()
+
+
+def draw_t_a(fig, t, a):
+    ax1 = fig.subplots()
+    ln1 = next_day_plotter(ax1, t, label='Temperature')
+    ax1.set_ylim(-5, 30)
+    ax1.set_xlabel('Time [H]')
+    ax1.set_ylabel('Temperature [℃]')
+    ax1.set_title('Weather [%s]' % a['date'])
+    ax1.grid()
+    ax2 = ax1.twinx()
+    ln2 = next_day_plotter(ax2, a, label='AQI', plot_kwargs={'color': 'orange'})
+    ax2.set_ylim(0, 500)
+    ax2.set_ylabel('Air Quality Index')
+    lns = ln1 + ln2
+    labs = [l.get_label() for l in lns]
+    ax1.legend(lns, labs)
+    fig.tight_layout()
+
+
+def draw_winds(fig, w):
+    ax = fig.subplots()
+    wind_plotter(ax, w)
+    ax.set_xlabel('Time [h]')
+    ax.set_ylabel('Wind Speed [m/s]')
+    ax.set_title('Wind Forcast [%s]' % w['date'])
+    fig.tight_layout()
+
+
+def draw_hourly(fig, data, ylabel, title):
+    ax = fig.subplots()
+    next_day_plotter(ax=ax, data_dict=data, label='')
+    ax.set_xlabel('Hour')
+    ax.set_ylabel(ylabel)
+    ax.set_title(f'{title} [{data["date"]}]')
+    ax.grid()
+    fig.tight_layout()
+
+
+def draw_general(fig, temp, aqi, pm25, visibility, cloudrate, humidity, precipitation, wind):
+    plotter = next_day_plotter
+    axs = fig.subplots(nrows=4, ncols=1, sharex=True)
+
+    # First axis Temperature & Precipitation
+    ln0a = plotter(axs[0], temp, label='Temperature', plot_kwargs={'color': 'orangered'})
+
+    # preset temperature limits
+    ymin_set = -10
+    ymax_set = 20
+    # move up
+    while np.max(temp['value']) > ymax_set:
+        ymax_set += 10
+        ymin_set += 10
+    # move down
+    while np.min(temp['value']) < ymin_set:
+        ymin_set -= 10
+        ymax_set -= 10
+    # adjust delta
+    while np.max(temp['value']) > ymax_set:
+        ymax_set += 10
+
+    axs[0].set_ylim(ymin_set, ymax_set)
+    axs[0].set_ylabel('Temperature [℃]')
+    axs[0].set_title('Weather [%s]' % temp['date'])
+    axs[0].grid()
+    ax0b = axs[0].twinx()
+    ln0b = plotter(ax0b, precipitation, label='Precipitation', plot_kwargs={'color': 'royalblue'})
+    ax0b.set_ylabel('Precipitation [mm/h]')
+    ax0b.set_ylim(0.1, 100)
+    ax0b.set_yscale('log')
+    ln0s = ln0a + ln0b
+    lab0s = [l.get_label() for l in ln0s]
+    axs[0].legend(ln0s, lab0s)
+
+    # Second axis AQI, pm25 & visibility
+    ln1a0 = plotter(axs[1], aqi, label='AQI', plot_kwargs={'color': 'darkgreen'})
+    ln1a1 = plotter(axs[1], pm25, label='PM2.5', plot_kwargs={'color': 'olive'})
+    axs[1].set_ylim(1, 1000)
+    axs[1].set_ylabel('Air Quality')
+    axs[1].set_yscale('log')
+    axs[1].grid()
+    ax1b = axs[1].twinx()
+    ln1b = plotter(ax1b, visibility, label='Visibility', plot_kwargs={'color': 'purple'})
+    ax1b.set_ylabel('Visibility [km]')
+    ax1b.set_ylim(0, 30)
+    ln1s = ln1a0 + ln1a1 + ln1b
+    lab1s = [l.get_label() for l in ln1s]
+    axs[1].legend(ln1s, lab1s)
+
+    # Third axis cloudrate & humidity
+    ln2a = plotter(axs[2], cloudrate, label='Cloudrate', plot_kwargs={'color': 'deepskyblue'})
+    axs[2].set_ylim(0, 1.05)
+    axs[2].set_ylabel('Cloudrate [%]')
+    axs[2].grid()
+    ax2b = axs[2].twinx()
+    ln2b = plotter(ax2b, humidity, label='Humidity', plot_kwargs={'color': 'springgreen'})
+    ax2b.set_ylabel('Humidity [%]')
+    ax2b.set_ylim(0, 1.05)
+    ln2s = ln2a + ln2b
+    lab2s = [l.get_label() for l in ln2s]
+    axs[2].legend(ln2s, lab2s)
+
+    # Forth axis Wind
+    wind_plotter(axs[3], wind)
+    axs[3].set_ylabel('Wind Speed [m/s]')
+    axs[3].set_xlabel('Time [H]')
+    axs[3].set_ylim(0, 13)
+
+    fig.tight_layout()
+
+
+def draw_p2h(fig, p):
+    ax = fig.subplots()
+    t = np.arange(120) + 1
+    ax.plot(t, p, color='royalblue')
+    ax.set_xlabel('Time [min]')
+    ax.set_ylabel('Precipitation [mm/h]')
+    ax.set_ylim(0.1, 100)
+    ax.set_yscale('log')
+    ax.set_title('Precipitation forcast in 2 hours')
+    ax.set_xlim(1, 120)
+    fig.tight_layout()
+
+
+def draw_wind_map(fig, img, xlist, ylist, slist, dlist, extent, title):
+    ax = fig.subplots()
+    s = np.array(slist)
+    d = np.array(dlist) * math.pi / 180
+    u = -s * np.sin(d) / 1.852
+    v = -s * np.cos(d) / 1.852
+
+    ax.barbs(xlist, ylist, u, v, pivot='middle')
+    ax.imshow(img, extent=extent)
+    ax.set_xlabel('Longitude [deg]')
+    ax.set_ylabel('Latitude [deg]')
+    ax.set_title(title)
+    fig.tight_layout()
@@ -1,6 +1,6 @@
 import pandas as pd
 from .paths import PATHS
-import os
+import os, threading
 
 # columns: type, platform, user_id
 PERM_FILE = os.path.join(PATHS['data'], 'permissions.xlsx')
@@ -31,26 +31,77 @@ if not os.path.exists(PERM_FILE):
     pd.DataFrame(PERMS).to_excel(PERM_FILE, index=False)
 
 
+# 进程内共用的权限缓存，只在权限文件变化（或被插件改写）后重新读取
+class PermissionStore:
+    def __init__(self, perm_file):
+        self.perm_file = perm_file
+        self._perms = {}  # {type: {platform: frozenset(user_ids)}}，空集表示全部通过
+        self._stat = None  # 上次读取时文件的(修改时间, 大小)
+        self._lock = threading.Lock()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.perm_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        perms = {}
+        for record in pd.read_excel(self.perm_file).to_dict('records'):
+            perm_t = perms.setdefault(record['type'], {})
+            list_p = perm_t.setdefault(record['platform'], [])
+            if list_p is None:  # 已出现all
+                continue
+            elif record['user_id'] == 'all':
+                perm_t[record['platform']] = None  # 表示全部通过
+            else:
+                list_p.append(str(record['user_id']))
+        for perm_t in perms.values():
+            for p, list_p in perm_t.items():
+                perm_t[p] = frozenset(list_p or [])
+        return perms
+
+    # 写入权限文件后调用，下次查询时重新读取
+    def invalidate(self):
+        with self._lock:
+            self._stat = None
+
+    def get_permissions(self) -> dict:
+        stat = self._file_stat()
+        if stat is None:  # 如果权限列表不存在
+            return {}
+        with self._lock:
+            if stat != self._stat:
+                self._perms = self._load()
+                self._stat = stat
+            return self._perms
+
+    def has_permission(self, perm_type, platform, user_id, default=False) -> bool:
+        """
+        :param default: 权限文件中没有这一权限类型时的返回值
+        """
+        perm_t = self.get_permissions().get(perm_type)
+        if perm_t is None:
+            return default
+        id_set = perm_t.get(platform)
+        if id_set is None:  # platform not in permission
+            return False
+        return not id_set or str(user_id) in id_set
+
+
+PERMISSION_STORE = PermissionStore(PERM_FILE)
+
+
+# 返回 {type: {platform: frozenset(user_ids)}}，空集表示全部通过，不要修改返回值
 def get_permissions():
-    # 如果权限列表不存在
-    if not os.path.exists(PERM_FILE):
-        return {}
-
-    df = pd.read_excel(PERM_FILE)
-    perm_list = {}
-    for t in set(df['type']):
-        df_t = df[df['type'] == t]
-        perm_t = {}
-        for p in set(df_t['platform']):
-            df_p = df_t[df_t['platform'] == p]
-            list_p = []  # 初始化，通常里面会包含内容
-            for u in df_p['user_id']:
-                if u == 'all':
-                    list_p = []  # 表示全部通过
-                    break
-                else:
-                    list_p.append(str(u))
-            perm_t[p] = list_p
-        perm_list[t] = perm_t
-
-    return perm_list
+    return PERMISSION_STORE.get_permissions()
+
+
+def has_permission(perm_type, platform, user_id, default=False):
+    return PERMISSION_STORE.has_permission(perm_type=perm_type, platform=platform,
+                                           user_id=user_id, default=default)
+
+
+def invalidate_permissions():
+    PERMISSION_STORE.invalidate()
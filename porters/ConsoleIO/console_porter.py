@@ -55,7 +55,7 @@ class ConsolePorter:
         request.msg = msg_input
 
         # 初始化分拣中心
-        distributor = Distributor()
+        distributor = Distributor(resident=True)  # 活动Session常驻内存
 
         # 把Resquest交给分拣中心，执行返回的Response序列
         try:
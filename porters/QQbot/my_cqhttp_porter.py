@@ -1,13 +1,16 @@
 import asyncio
 import websockets
+import httpx
 import json
 import re
 import html
 import logging
 import traceback
-import requests
 import xml
 import os
+import functools
+import contextlib
+import concurrent.futures
 from ...requests import Request
 from ...responses import *
 from ...distributor import Distributor
@@ -16,6 +19,38 @@ from ...paths import PATHS
 from ...server_config import CQHTTP_URL, CQHTTP_IWS_PORT
 
 BLACKLIST = [3288849221]
+DISTRIBUTOR_WORKERS = 4  # 同时处理消息的线程数，插件中的阻塞操作（网络请求、selenium、画图）在线程中执行
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=DISTRIBUTOR_WORKERS, thread_name_prefix='MultiBotCQ')
+USER_LOCKS = {}  # user_id -> {'lock': asyncio.Lock, 'count': 等待数}，同一用户的消息按收到的顺序处理
+BACKGROUND_TASKS = set()  # 正在处理的消息，防止task被回收
+_HTTP_CLIENT = None
+
+
+# 在线程池中执行阻塞的函数，不阻塞websocket
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, functools.partial(func, *args, **kwargs))
+
+
+# 同一用户的消息依次处理，不同用户之间并行
+@contextlib.asynccontextmanager
+async def user_order(user_id):
+    entry = USER_LOCKS.setdefault(user_id, {'lock': asyncio.Lock(), 'count': 0})
+    entry['count'] += 1
+    try:
+        async with entry['lock']:
+            yield
+    finally:
+        entry['count'] -= 1
+        if entry['count'] == 0:
+            USER_LOCKS.pop(user_id, None)
+
+
+def get_http_client():
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(base_url=CQHTTP_URL, timeout=30)
+    return _HTTP_CLIENT
 
 
 # via aiocqhttp.message.Message._split_iter
@@ -164,8 +199,18 @@ async def porter(json_data, websocket):
                           f"{str(message).replace('CQ:', '$CQ$:')}"
             continue
 
+    async with user_order(request.user_id):
+        await dispatch(request=request, websocket=websocket, bot_called=bot_called,
+                       sender_id=_sender_id, group_id=_group_id)
+
+
+# 把Request交给分拣中心（在线程池中），并执行返回的Response序列
+async def dispatch(request, websocket, bot_called, sender_id, group_id):
+    _sender_id = sender_id
+    _group_id = group_id
+
     # 初始化分拣中心
-    distributor = Distributor()
+    distributor = Distributor(resident=True)  # 活动Session常驻内存
 
     # 获取Response序列，同时下载图片，若出错则返回错误信息
     def get_responses():
@@ -183,8 +228,8 @@ async def porter(json_data, websocket):
             await websocket.send(json.dumps({"action": "send_group_msg",
                                              "params": {"group_id": group_id, "message": message}}))
 
-    def call_api(api, params):
-        r = requests.get(f'{CQHTTP_URL}/{api}', params)
+    async def call_api(api, params):
+        r = await get_http_client().get(f'/{api}', params=params)
         return r.json()['data']
 
     # 用于执行Response序列
@@ -220,8 +265,9 @@ async def porter(json_data, websocket):
                     else:
                         await send(group_id=response.group_id, message=img_msg)
                 elif isinstance(response, ResponseCQFunc):
-                    output = call_api(api=response.func_name, params=response.kwargs)
-                    await execute(distributor.process_output(output=output))  # 递归处理新的Response序列
+                    output = await call_api(api=response.func_name, params=response.kwargs)
+                    # 递归处理新的Response序列
+                    await execute(await run_blocking(distributor.process_output, output=output))
             except:
                 # 诸如发送失败等问题
                 logging.error(traceback.format_exc())
@@ -229,16 +275,16 @@ async def porter(json_data, websocket):
     # 在筛选后，把Request交给分拣中心，执行返回的Response序列
     if bot_called:
         # 符合呼出条件的，直接执行
-        await execute(response_list=get_responses())
-    elif distributor.use_active(request=request, save=False):
+        await execute(response_list=await run_blocking(get_responses))
+    elif await run_blocking(distributor.use_active, request=request, save=False):
         # 不符合呼出条件的，若有活动Session对应，也可以执行
-        await execute(response_list=get_responses())
+        await execute(response_list=await run_blocking(get_responses))
     else:
         logging.debug('=========== [MultiBot] Left nonebot porter ==========')
         return
 
     # 刷新并保存最新的session信息
-    distributor.refresh_and_save()
+    await run_blocking(distributor.refresh_and_save)
 
     logging.debug('=========== [MultiBot] Completed nonebot porter ==========')
 
@@ -253,7 +299,17 @@ async def printer(websocket):
             continue
         else:
             print(json_data)
-            await porter(json_data=json_data, websocket=websocket)
+            # 不等待处理完成，继续接收下一条消息
+            task = asyncio.create_task(porter(json_data=json_data, websocket=websocket))
+            BACKGROUND_TASKS.add(task)
+            task.add_done_callback(_task_done)
+
+
+def _task_done(task):
+    BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        e = task.exception()
+        logging.error(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
 
 
 async def my_porter_main():
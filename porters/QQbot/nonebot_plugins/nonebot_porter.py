@@ -136,7 +136,7 @@ async def porter(session: CommandSession):
             continue
 
     # 初始化分拣中心
-    distributor = Distributor()
+    distributor = Distributor(resident=True)  # 活动Session常驻内存
 
     # 获取Response序列，同时下载图片，若出错则返回错误信息
     def get_responses():
@@ -94,7 +94,7 @@ class WCEnterprisePorter:
             return
         # 初始化分拣中心
         if not cron_task:
-            distributor = Distributor()
+            distributor = Distributor(resident=True)  # 活动Session常驻内存
         else:
             distributor = DistributorCron()
         try:
@@ -37,7 +37,7 @@ class WCPublicPorter:
     @staticmethod
     def get_response(request):
         # 初始化分拣中心
-        distributor = Distributor()
+        distributor = Distributor(resident=True)  # 活动Session常驻内存
         try:
             response_list = distributor.handle(request=request)
         except:
@@ -0,0 +1,147 @@
+# 画图服务：插件把画图函数和数据交给画图进程，用matplotlib的面向对象接口（Agg）画图并保存
+# 不使用pyplot，图不会留在全局状态中，画完即释放；不同用户的画图可以同时进行
+# 画图函数需定义在figures.py中，形如draw(fig, **kwargs)，只在传入的Figure上作图
+# 画图进程运行独立的render_worker.py脚本，只载入figures.py，不导入MultiBot包；每个进程同时只画一张图，超时时只结束这一个进程
+from . import figures
+import subprocess, threading, queue, pickle, atexit, os, sys
+
+RENDER_WORKERS = 2  # 画图进程数
+RENDER_TIMEOUT = 60  # 每张图的最长时间（秒），超时后结束画图进程
+MAX_TASKS_PER_WORKER = 200  # 每个进程画图次数上限，之后换新进程，保持内存稳定
+PRELOAD_FONTS = ['Microsoft Yahei']  # 进程启动时预先载入的字体
+CJK_RC = {'font.family': 'sans-serif', 'font.sans-serif': ['Microsoft Yahei']}  # 有中文的图，只对该图生效
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'render_worker.py')
+
+
+class RenderError(RuntimeError):
+    pass
+
+
+class RenderTimeoutError(RenderError, TimeoutError):
+    pass
+
+
+# 一个画图进程，通过stdin/stdout传递pickle后的任务和结果
+class _Worker:
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT] + PRELOAD_FONTS,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.results = queue.Queue()
+        self.uses = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+    # 在单独的线程中读取结果，进程退出时放入None
+    def _read(self):
+        try:
+            while True:
+                self.results.put(pickle.load(self.process.stdout))
+        except Exception:
+            self.results.put(None)
+
+    def submit(self, job):
+        pickle.dump(job, self.process.stdin)
+        self.process.stdin.flush()
+        self.uses += 1
+
+    def close(self):
+        try:
+            self.process.stdin.close()  # 画图进程读到EOF后退出
+            self.process.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class RenderService:
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT, max_tasks=MAX_TASKS_PER_WORKER):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self._idle = []  # 空闲的画图进程
+        self._n_workers = 0  # 已启动（包括正在画图）的进程数量
+        self._cond = threading.Condition()
+
+    # 取一个空闲的画图进程，达到上限时等待其他线程画完
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while not self._idle and self._n_workers >= self.workers:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._n_workers += 1
+        try:
+            return _Worker()
+        except BaseException:
+            self._discard()
+            raise
+
+    def _discard(self):
+        with self._cond:
+            self._n_workers -= 1
+            self._cond.notify()
+
+    # 归还画图进程；discard为True（超时、进程退出）或画图次数达到上限时结束它
+    def _release(self, worker, discard=False):
+        if discard or worker.uses >= self.max_tasks or worker.process.poll() is not None:
+            if discard:
+                worker.kill()
+            else:
+                worker.close()
+            self._discard()
+        else:
+            with self._cond:
+                self._idle.append(worker)
+                self._cond.notify()
+
+    def render(self, draw, filename=None, figsize=None, rc=None, timeout=None, **kwargs):
+        """
+        :param draw: figures.py中的画图函数draw(fig, **kwargs)
+        :param filename: 图片保存路径，为None时返回PNG图片的bytes
+        :param figsize: Figure的尺寸，默认为matplotlib的默认值
+        :param rc: 只对这张图生效的matplotlib设置，如CJK_RC
+        :return: filename，或PNG图片的bytes
+        """
+        if getattr(figures, draw.__name__, None) is not draw:
+            raise ValueError(f'{draw.__name__} is not defined in figures.py')
+        if timeout is None:
+            timeout = self.timeout
+        worker = self._acquire()
+        discard = True
+        try:
+            worker.submit((draw.__name__, filename, figsize, rc, kwargs))
+            try:
+                result = worker.results.get(timeout=timeout)
+            except queue.Empty:  # 只结束这一个画图进程，其他进程中的图不受影响
+                raise RenderTimeoutError(f'{draw.__name__} took more than {timeout} s')
+            if result is None:
+                raise RenderError(f'render worker exited while drawing {draw.__name__}')
+            discard = False
+            status, value = result
+            if status == 'error':  # 画图函数报错，进程仍可继续使用
+                raise RenderError(value)
+            return value
+        finally:
+            self._release(worker, discard=discard)
+
+    # 结束所有空闲的画图进程
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._n_workers -= len(idle)
+            self._cond.notify_all()
+        for worker in idle:
+            worker.close()
+
+
+RENDER_SERVICE = RenderService()
+atexit.register(RENDER_SERVICE.close)
+
+
+def render(draw, filename=None, **kwargs):
+    return RENDER_SERVICE.render(draw, filename=filename, **kwargs)
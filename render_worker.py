@@ -0,0 +1,60 @@
+# 画图进程（见render_service），作为独立脚本运行：python render_worker.py [预先载入的字体...]
+# 不导入MultiBot包，只按文件载入同目录下的figures.py；从stdin读取任务，向stdout写入结果（均为pickle）
+import sys, os
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 包目录中有requests.py等与第三方库同名的模块，不能留在搜索路径中
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or os.curdir) != HERE]
+
+import pickle, traceback, importlib.util
+from io import BytesIO
+
+
+def _load_figures():
+    spec = importlib.util.spec_from_file_location('multibot_figures', os.path.join(HERE, 'figures.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _render_job(figures, draw_name, filename, figsize, rc, kwargs):
+    import matplotlib
+    from matplotlib.figure import Figure
+    with matplotlib.rc_context(rc):
+        fig = Figure(figsize=figsize)
+        try:
+            getattr(figures, draw_name)(fig, **kwargs)
+            if filename is None:
+                buffer = BytesIO()
+                fig.savefig(buffer, format='png')
+                return buffer.getvalue()
+            fig.savefig(filename)
+            return filename
+        finally:
+            fig.clear()
+
+
+def main(fonts):
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr  # 画图函数的输出不能混入结果
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import font_manager
+    for family in fonts:
+        font_manager.findfont(font_manager.FontProperties(family=family))
+    figures = _load_figures()
+    while True:
+        try:
+            job = pickle.load(stdin)
+        except EOFError:  # 主进程关闭了stdin
+            return
+        try:
+            result = ('ok', _render_job(figures, *job))
+        except Exception:
+            result = ('error', traceback.format_exc())
+        pickle.dump(result, stdout)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
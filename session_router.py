@@ -0,0 +1,95 @@
+from .sessions.general import Session, check_permission
+from .sessions.argument import ArgSession
+from .external.keyword_automaton import KeywordAutomaton
+from .permissions import has_permission
+
+
+# 插件路由索引，载入时为每个Session类建立一次关键词索引和唤起声明（SessionSpec）
+# 收到新消息时只返回关键词匹配的Session类，以及不依赖关键词唤起的Session类（如图灵、复读、待命）
+class SessionRouter:
+    def __init__(self, session_classes):
+        self.session_classes = list(session_classes)
+        self._order = {session_class: i for i, session_class in enumerate(self.session_classes)}
+        self._specs = {}  # Session类 -> SessionSpec
+        self._strict_index = {}  # 小写的strict command -> SessionSpec序列
+        self._extend_automaton = KeywordAutomaton()  # 小写的extend command -> SessionSpec
+        self._always_candidates = []  # 每条消息都需要检查的SessionSpec
+        for session_class in self.session_classes:
+            self._add(SessionSpec(session_class))
+        self._extend_automaton.compile()  # 之后只读，多线程共用
+
+    def _add(self, spec):
+        self._specs[spec.session_class] = spec
+        if not spec.routed_by_command or '' in spec.extend_commands:  # 空关键词包含于任何消息中
+            self._always_candidates.append(spec)
+            return
+        for command in spec.extend_commands:
+            self._extend_automaton.add(command, spec)
+        for command in spec.strict_commands:
+            self._strict_index.setdefault(command, []).append(spec)
+
+    # 返回可能被request唤起的SessionSpec，保持原列表的顺序（唤起率相同时靠前者优先）
+    def candidates(self, request) -> list:
+        found = set(self._always_candidates)
+        msg = request.msg
+        if isinstance(msg, str):
+            keys = [msg.lower()]
+            words = msg.split()
+            if words:  # ArgSession只检查第一个词
+                keys.append(words[0].lower())
+            for key in keys:
+                found.update(self._strict_index.get(key, []))
+            found.update(self._extend_automaton.search(keys[0]))
+        return sorted(found, key=lambda spec: self._order[spec.session_class])
+
+
+# Session类的唤起声明，由类属性和载入时读取一次的关键词组成
+# declarative为True时，分拣中心直接用它判断唤起，只为最终选中的插件创建Session
+class SessionSpec:
+    def __init__(self, session_class):
+        self.session_class = session_class
+        prototype = session_class(user_id='')  # 只在载入时实例化一次，读取关键词
+        self.extend_commands = [command.lower() for command in prototype.extend_commands]
+        self.strict_commands = [command.lower() for command in prototype.strict_commands]
+        self.permissions = prototype.permissions
+        self.permissions_key = session_class.permissions_key
+        self.extend_p = session_class._extend_p
+        self.strict_p = session_class._strict_p
+        self.text_only = session_class._text_only
+        self.first_word_only = session_class.probability_to_call is ArgSession.probability_to_call
+        # 未重写probability_to_call的Session只在关键词匹配时唤起
+        self.routed_by_command = session_class.probability_to_call in [Session.probability_to_call,
+                                                                       ArgSession.probability_to_call]
+        # 唤起判断全部由类属性决定，不需要实例化
+        self.declarative = self.routed_by_command and \
+            session_class.is_legal_request is Session.is_legal_request and \
+            session_class._permission is Session._permission and \
+            session_class._called_by_command is Session._called_by_command and \
+            session_class._text_request_only is Session._text_request_only
+
+    # 与Session.is_legal_request等价
+    def is_legal_request(self, request):
+        if self.text_only and not (request.msg and not request.img):
+            return False
+        if self.permissions_key is not None:
+            return has_permission(self.permissions_key, request.platform, request.user_id, default=True)
+        return check_permission(permissions=self.permissions, platform=request.platform, user_id=request.user_id)
+
+    # 与Session/ArgSession.probability_to_call等价
+    def probability_to_call(self, request):
+        msg = request.msg
+        if not isinstance(msg, str):
+            return 0
+        if self.first_word_only:
+            words = msg.split()
+            if not words:
+                return 0
+            msg = words[0]
+        msg = msg.lower()
+        for command in self.extend_commands:
+            if command in msg:
+                return self.extend_p
+        for command in self.strict_commands:
+            if command == msg:
+                return self.strict_p
+        return 0
@@ -2,12 +2,12 @@ from .argument import ArgSession
 from ..responses import ResponseMsg, ResponseImg
 from ..paths import PATHS
 from ..utils import image_filename
-from ..permissions import get_permissions
 from ..external.record_table import RecordTable, RecordNotFoundError
+from ..render_service import render, CJK_RC
+from ..figures import draw_pie, draw_curves
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import datetime, os
+import datetime, os, threading
 
 ACCOUNT_DIR = os.path.join(PATHS['data'], 'accounts')
 if os.path.exists(ACCOUNT_DIR):
@@ -15,6 +15,9 @@ if os.path.exists(ACCOUNT_DIR):
 else:
     os.makedirs(ACCOUNT_DIR)
 
+_BOOK_AGGREGATES = {}  # 账本文件 -> AccountAggregates，账本被其他方式改写后重新统计
+_AGGREGATES_LOCK = threading.RLock()  # append中写入时会经过_changed再次获取
+
 
 class AccountUpdateSession(ArgSession):
     def __init__(self, user_id):
@@ -87,6 +90,8 @@ class AccountUpdateSession(ArgSession):
 
 
 class AccountViewSession(ArgSession):
+    permissions_key = 'AccountView'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '账本统计'
@@ -98,7 +103,6 @@ class AccountViewSession(ArgSession):
                 commands.append(a+b)
                 commands.append(b+a)
         self.strict_commands = commands
-        self.permissions = get_permissions().get('AccountView', {})
         self.add_arg(key='book', alias_list=['-bk', '-b'],
                      required=False, get_next=True,
                      default_value=user_id,
@@ -150,6 +154,8 @@ class AccountViewSession(ArgSession):
 
 
 class AccountDelSession(ArgSession):
+    permissions_key = 'AccountView'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '账本删改'
@@ -161,7 +167,6 @@ class AccountDelSession(ArgSession):
                 commands.append(a+b)
                 commands.append(b+a)
         self.strict_commands = commands
-        self.permissions = get_permissions().get('AccountView', {})
         self.add_arg(key='book', alias_list=['-bk', '-b'],
                      required=False, get_next=True,
                      default_value=user_id,
@@ -221,6 +226,37 @@ class AccountDelSession(ArgSession):
                                    f'请回复需继续删除的条目序号')
 
 
+# 账本中支出的逐日汇总：日期 -> {(类别, 地点): 金额}，记账时增量更新，统计时只取需要的日期
+class AccountAggregates:
+    def __init__(self, records, stat):
+        self.stat = stat  # 统计时账本文件的stat
+        self.daily = {}
+        df = pd.DataFrame(records, columns=['date', 'category', 'place', 'amount'])
+        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
+        df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
+        df = df[df['date'].notna() & (df['amount'] <= 0)]  # 保留支出项
+        for (date, category, place), amount in df.groupby(['date', 'category', 'place'],
+                                                          dropna=False)['amount'].sum().items():
+            self.daily.setdefault(date, {})[(category, place)] = -amount
+
+    def add(self, record):
+        amount = float(record['amount'])
+        if amount > 0:
+            return
+        day = self.daily.setdefault(datetime.date.fromisoformat(record['date']), {})
+        key = (record['category'], record['place'])
+        day[key] = day.get(key, 0) - amount
+
+    # [date_initial, date_final)内的支出，每行为一天中一个(类别, 地点)的总额
+    def expenses(self, date_initial: datetime.date, date_final: datetime.date) -> pd.DataFrame:
+        rows = []
+        for n in range((date_final - date_initial).days):
+            date = date_initial + datetime.timedelta(days=n)
+            for (category, place), amount in self.daily.get(date, {}).items():
+                rows.append((date, category, place, amount))
+        return pd.DataFrame(rows, columns=['date', 'category', 'place', 'amount'])
+
+
 class AccountBook(RecordTable):
     def __init__(self, book_name):
         RecordTable.__init__(self,
@@ -231,12 +267,35 @@ class AccountBook(RecordTable):
                user_tag='nobody', category='expense',
                content='nothing', place='nowhere', amount=0, note=''):
         append_date, append_time = datetime.datetime.now().isoformat().split('T')
-
-        self.append_full({'date': append_date, 'time': append_time,
-                          'platform': platform, 'user_id': user_id,
-                          'user_tag': user_tag, 'category': category,
-                          'content': content, 'place': place,
-                          'amount': amount, 'note': note})
+        record = {'date': append_date, 'time': append_time,
+                  'platform': platform, 'user_id': user_id,
+                  'user_tag': user_tag, 'category': category,
+                  'content': content, 'place': place,
+                  'amount': amount, 'note': note}
+
+        with _AGGREGATES_LOCK:
+            aggregates = _BOOK_AGGREGATES.get(self.table_file)
+            up_to_date = aggregates is not None and aggregates.stat == self.stat()
+            self.append_full(record)  # _changed会丢弃汇总
+            if up_to_date:  # 增量更新汇总后放回，否则下次统计时重新读取
+                aggregates.add(record)
+                aggregates.stat = self.stat()
+                _BOOK_AGGREGATES[self.table_file] = aggregates
+
+    # 本进程写入（包括删除、替换）后丢弃汇总；其他进程的写入仍由stat判断
+    # SQLite的删除和替换一般不改变文件大小，只靠修改时间判断可能漏掉同一时刻内的改动
+    def _changed(self):
+        with _AGGREGATES_LOCK:
+            _BOOK_AGGREGATES.pop(self.table_file, None)
+
+    # 本账本的支出汇总，账本文件有变化时重新统计
+    def aggregates(self) -> AccountAggregates:
+        with _AGGREGATES_LOCK:
+            stat = self.stat()
+            aggregates = _BOOK_AGGREGATES.get(self.table_file)
+            if aggregates is None or aggregates.stat != stat:
+                aggregates = _BOOK_AGGREGATES[self.table_file] = AccountAggregates(self.get_dfl(), stat)
+            return aggregates
 
     @staticmethod
     def list_single_record(record) -> str:
@@ -244,28 +303,20 @@ class AccountBook(RecordTable):
                f"{record['category']}/{record['content']}/{record['place']}/{record['amount']}"
 
     # via xgg 20220423
+    # df: AccountAggregates.expenses的结果
     def _plot_statistics(self, df, sort_by='category'):
-        date_list = []
-        for date_str in df['date']:
-            date_list.append(datetime.date.fromisoformat(date_str))
-        date_initial = min(date_list)
-        date_last = max(date_list)
+        date_initial = df['date'].min()
+        date_last = df['date'].max()
         date_final = date_last + datetime.timedelta(days=1)
         # 处理
 
-        group = df.groupby(sort_by).sum()
+        group = df.groupby(sort_by)[['amount']].sum()
         total = np.sum(df['amount'])
 
-        # Chinese character
-        plt.rcParams['font.family'] = 'sans-serif'
-        plt.rcParams['font.sans-serif'] = 'Microsoft Yahei'
-
-        # plotA
+        # plotA（中文字体只对这张图生效）
         img_pie = image_filename(header='AccountBookPie', abs_path=True)
-        fig, ax = plt.subplots()
-        ax.pie(group['amount'], labels=group.index, autopct='%3.1f%%')
-        fig.tight_layout()
-        fig.savefig(img_pie)
+        render(draw_pie, filename=img_pie, rc=CJK_RC,
+               amounts=list(group['amount']), labels=list(group.index))
 
         # plotB
         img_curve = image_filename(header='AccountBookCurve', abs_path=True)
@@ -276,27 +327,17 @@ class AccountBook(RecordTable):
         xticklabels = [''] * n_days
         for j in range(0, n_days, delta_ticklabels):
             xticklabels[j] = (date_initial + datetime.timedelta(days=j)).isoformat()[-5:]
-        # separate
-        expenses_lines = {'total': np.zeros(shape=n_days)}
-        for i in df.to_dict('records'):
-            line_type = i[sort_by]
-            if line_type not in expenses_lines.keys():
-                expenses_lines[line_type] = np.zeros(shape=n_days)
-            expenses_lines['total'][(i['date_obj'] - date_initial).days] += i['amount']
-            expenses_lines[line_type][(i['date_obj'] - date_initial).days] += i['amount']
+        # separate，按天、按类型汇总
+        daily = df.assign(date=pd.to_datetime(df['date'])) \
+            .groupby([pd.Grouper(key='date', freq='D'), sort_by])['amount'].sum() \
+            .unstack(fill_value=0) \
+            .reindex(pd.date_range(date_initial, periods=n_days, freq='D'), fill_value=0)
+        expenses_lines = {'total': daily.sum(axis=1).to_numpy()}
+        for line_type in daily.columns:
+            expenses_lines[line_type] = daily[line_type].to_numpy()
         # make figure
-        fig, ax = plt.subplots()
-        for line_type, y in expenses_lines.items():
-            ax.plot(xx, y, label=line_type)
-        ax.legend()
-        ax.grid()
-        ax.set(xticks=xx, xticklabels=xticklabels)
-        fig.tight_layout()
-        fig.savefig(img_curve)
-
-        # reverse
-        plt.rcParams['font.family'] = plt.rcParamsDefault['font.family']
-        plt.rcParams['font.sans-serif'] = plt.rcParamsDefault['font.sans-serif']
+        render(draw_curves, filename=img_curve, rc=CJK_RC,
+               xx=xx, lines=expenses_lines, xticklabels=xticklabels)
 
         return {'msg': f'分类统计:\n{group.amount}\n总计:{total}',
                 'img_pie': img_pie,
@@ -308,16 +349,8 @@ class AccountBook(RecordTable):
     def statistics(self, date_initial: datetime.date, date_final: datetime.date, category=None):
         # 不使用isinstance(date, datetime.date)，因为datetime对象也会返回True
         assert type(date_initial) == datetime.date and type(date_final) == datetime.date
-        df = pd.read_excel(self.table_file)
-        # 将pandas dataframe中的string日期转为datetime.date对象
-        date_list = []
-        for date_str in df['date']:
-            date_list.append(datetime.date.fromisoformat(date_str))
-        df['date_obj'] = date_list  # 将datetime.date对象的列表放到dataframe中
-        # 筛选数据到new_df
-        new_df = df[(date_initial <= df['date_obj']) & (df['date_obj'] < date_final)]  # 日期筛选
-        new_df = new_df[new_df['amount'] <= 0]  # 保留支出项
-        new_df['amount'] *= -1
+        # 从汇总中取出日期范围内的支出（金额为正）
+        new_df = self.aggregates().expenses(date_initial=date_initial, date_final=date_final)
 
         if category is None:
             return self._plot_statistics(df=new_df, sort_by='category')
@@ -1,8 +1,10 @@
 from .general import Session
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
+from ..requests import Request
 from ..paths import PATHS
-import os, csv
+from ..external.keyword_automaton import KeywordAutomaton
+import os, csv, threading
 
 BOX_DIR = PATHS['box']
 BOX_FILE = os.path.join(BOX_DIR, 'alias_box.csv')
@@ -14,31 +16,92 @@ if not os.path.exists(BOX_FILE):
                          'value': 'value'})
 
 
+# 编译后的同义词库：严格关键词用dict查找，不严格关键词（末尾“+”）用KeywordAutomaton一次扫描
+# 载入时即检查每条同义指令是否会再次唤起同义词机或同义词库更新（自我递归），查找时不再创建Session
+class AliasBox:
+    def __init__(self, table=()):
+        self.items = []  # 解析后的同义词：{'value', 'recursive'}
+        self.strict_index = {}  # 小写关键词 -> 序号列表
+        self.extend_automaton = KeywordAutomaton()  # 小写关键词 -> 序号
+        self.extend_all = []  # 空的不严格关键词（“+”），包含于任何消息中
+        self.extend_commands = []
+        self.strict_commands = []
+        for row in table:
+            command = row['key']
+            if not command:
+                continue
+            i = len(self.items)
+            self.items.append({'value': row['value'], 'recursive': False})
+            if command[-1] == '+':
+                command = command[:-1]
+                self.extend_commands.append(command)
+                if command:
+                    self.extend_automaton.add(command.lower(), i)
+                else:
+                    self.extend_all.append(i)
+            else:
+                self.strict_commands.append(command)
+                self.strict_index.setdefault(command.lower(), []).append(i)
+        self.extend_automaton.compile()  # 之后只读，多线程共用
+
+        add_alias = AddAliasSession(user_id='')
+        for item in self.items:
+            new_req = Request()
+            new_req.msg = item['value']
+            item['recursive'] = self.probability(item['value'], extend_p=65, strict_p=85) > 0 or \
+                add_alias.probability_to_call(request=new_req) > 0
+
+    # 与Session._called_by_command等价
+    def probability(self, msg, extend_p, strict_p):
+        if not isinstance(msg, str):
+            return 0
+        msg = msg.lower()
+        if self.extend_all or self.extend_automaton.search(msg):
+            return extend_p
+        if msg in self.strict_index:
+            return strict_p
+        return 0
+
+    # 符合msg的同义词序号，按同义词库中的顺序
+    def match(self, msg) -> list:
+        msg = msg.lower()
+        indices = set(self.extend_all + self.extend_automaton.search(msg))
+        indices.update(self.strict_index.get(msg, []))
+        return sorted(indices)
+
+
+# 同义词库缓存，文件修改后才重新读取
+_BOX_CACHE = {'stat': None, 'box': None}
+_BOX_LOCK = threading.Lock()
+
+
+def load_alias_box(force=False) -> AliasBox:
+    try:
+        stat = os.stat(BOX_FILE)
+    except FileNotFoundError:
+        return AliasBox()
+    stat = (stat.st_mtime_ns, stat.st_size)
+    with _BOX_LOCK:
+        if stat == _BOX_CACHE['stat'] and not force:
+            return _BOX_CACHE['box']
+        with open(BOX_FILE, 'r', encoding='utf-8') as f:
+            box = AliasBox(list(csv.DictReader(f)))
+        _BOX_CACHE.update({'stat': stat, 'box': box})
+        return box
+
+
 class AutoAliasSession(Session):
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self.session_type = '同义词机'
         self.description = '从同义词数据库中获取关键词，并等价为一个指令，多个符合时会返回多个'
-        self.answer_table = []
-        self._load_table()
+        self.box = load_alias_box()  # 只读，多个Session共用
+        self.extend_commands = self.box.extend_commands
+        self.strict_commands = self.box.strict_commands
         self._list_commands = False
 
     def probability_to_call(self, request):
-        return self._called_by_command(request=request, extend_p=65, strict_p=85)
-
-    def _load_table(self):
-        try:
-            with open(BOX_FILE, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    self.answer_table.append(row)
-                    command = row['key']
-                    if command[-1] == '+':
-                        self.extend_commands.append(command[:-1])
-                    else:
-                        self.strict_commands.append(command)
-        except FileNotFoundError:
-            return
+        return self.box.probability(request.msg, extend_p=65, strict_p=85)
 
     def handle(self, request):
         self.deactivate()
@@ -46,24 +109,15 @@ class AutoAliasSession(Session):
         # get alias commands and check
         values = []
         results = []
-        for item in self.answer_table:
-            command = item['key']
-            if command[-1] == '+' and command[:-1].lower() in request.msg.lower():
-                # extended command
-                pass
-            elif command.lower() == request.msg.lower():
-                # strict command
-                pass
-            else:
-                continue
-            value = item['value']
-            new_req = request.new()
-            new_req.msg = value
+        for i in self.box.match(request.msg):
+            item = self.box.items[i]
             # check no iterate
-            if self.probability_to_call(request=new_req) <= 0:
-                if AddAliasSession(user_id=self.user_id).probability_to_call(request=new_req) <= 0:
-                    results.append(new_req)
-                    values.append(value)
+            if not item['recursive']:
+                value = item['value']
+                new_req = request.new()
+                new_req.msg = value
+                results.append(new_req)
+                values.append(value)
 
         # alias report
         report = f'【{self.session_type}】关键词“{request.msg}”转义为：'
@@ -78,6 +132,8 @@ class AutoAliasSession(Session):
 
 
 class AddAliasSession(ArgSession):
+    _text_only = False
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '同义词库更新'
@@ -98,13 +154,11 @@ class AddAliasSession(ArgSession):
                                   '部分指令（需要返回值的）可能会有问题。\n' \
                                   '同义词机的优先级低于其他明确指令和问答机。'
 
-    def is_legal_request(self, request):
-        return True
-
     def _add_alias(self):
         with open(BOX_FILE, 'a+', newline='', encoding='utf-8') as f:
             writer = csv.DictWriter(f, fieldnames=['key', 'value'])
             writer.writerow({'key': self.add_key, 'value': self.add_value})
+        load_alias_box(force=True)  # 写入后立即重新编译同义词库
 
     def info(self):
         text = '关键词：{}'.format(self.add_key)
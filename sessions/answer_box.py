@@ -3,7 +3,8 @@ from .argument import ArgSession, Argument
 from ..responses import ResponseMsg, ResponseImg
 from ..paths import PATHS
 from ..utils import image_filename
-import os, csv, shutil, random
+from ..external.keyword_automaton import KeywordAutomaton
+import os, csv, shutil, random, threading
 
 BOX_DIR = PATHS['box']
 BOX_FILE = os.path.join(BOX_DIR, 'answer_box.csv')
@@ -16,70 +17,102 @@ if not os.path.exists(BOX_FILE):
                          'answer_img': 'answer_img'})
 
 
+# 编译后的问答库：前缀“/”和末尾“+”在载入时解析，严格问题用dict查找，不严格问题用KeywordAutomaton一次扫描
+class AnswerBox:
+    def __init__(self, table=()):
+        self.items = []  # 解析后的问答：{'to_choose', 'answer_text', 'answer_img'}
+        self.strict_index = {}  # 小写问题 -> 问答序号列表
+        self.extend_automaton = KeywordAutomaton()  # 小写问题 -> 问答序号
+        self.extend_all = []  # 空的不严格问题（“+”），包含于任何消息中
+        self.extend_commands = []
+        self.strict_commands = []
+        for row in table:
+            command = row['question']
+            to_choose = command[:1] == '/'
+            if to_choose:
+                command = command[1:]
+                if len(command) == 0 or command == '+':
+                    # empty question, do not search
+                    continue
+            extended = command[-1:] == '+'
+            if extended:
+                command = command[:-1]
+            elif not command:
+                continue
+            i = len(self.items)
+            self.items.append({'to_choose': to_choose,
+                               'answer_text': row['answer_text'],
+                               'answer_img': row['answer_img']})
+            if extended:
+                self.extend_commands.append(command)
+                if command:
+                    self.extend_automaton.add(command.lower(), i)
+                else:
+                    self.extend_all.append(i)
+            else:
+                self.strict_commands.append(command)
+                self.strict_index.setdefault(command.lower(), []).append(i)
+        self.extend_automaton.compile()  # 之后只读，多线程共用
+
+    # 与Session._called_by_command等价
+    def probability(self, msg, extend_p, strict_p):
+        if not isinstance(msg, str):
+            return 0
+        msg = msg.lower()
+        if self.extend_all or self.extend_automaton.search(msg):
+            return extend_p
+        if msg in self.strict_index:
+            return strict_p
+        return 0
+
+    # 符合msg的问答序号（按问答库中的顺序），有严格问题符合时只返回严格问题的
+    def match(self, msg) -> list:
+        msg = msg.lower()
+        if msg in self.strict_index:
+            return self.strict_index[msg]
+        return sorted(self.extend_all + self.extend_automaton.search(msg))
+
+
+# 问答库缓存，文件修改后才重新读取
+_BOX_CACHE = {'stat': None, 'box': AnswerBox()}
+_BOX_LOCK = threading.Lock()
+
+
+def load_answer_box(force=False) -> AnswerBox:
+    try:
+        stat = os.stat(BOX_FILE)
+    except FileNotFoundError:
+        return AnswerBox()
+    stat = (stat.st_mtime_ns, stat.st_size)
+    with _BOX_LOCK:
+        if stat == _BOX_CACHE['stat'] and not force:
+            return _BOX_CACHE['box']
+        with open(BOX_FILE, 'r', encoding='utf-8') as f:
+            box = AnswerBox(list(csv.DictReader(f)))
+        _BOX_CACHE.update({'stat': stat, 'box': box})
+        return box
+
+
 class AutoAnswerSession(Session):
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self.session_type = '问答机'
         self.description = '从问答数据库中获取问答，并自动回复，有多条符合时会全部回复（除非设定只选一条）'
-        self.answer_table = []
-        self._load_table()
+        self.box = load_answer_box()  # 只读，多个Session共用
+        self.extend_commands = self.box.extend_commands
+        self.strict_commands = self.box.strict_commands
         self._list_commands = False
 
     def probability_to_call(self, request):
-        return self._called_by_command(request=request, extend_p=70, strict_p=90)
-
-    def _load_table(self):
-        try:
-            with open(BOX_FILE, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    self.answer_table.append(row)
-                    command = row['question']
-                    if command[0] == '/':
-                        command = command[1:]
-                        if len(command) == 0 or command == '+':
-                            # empty question, do not search
-                            continue
-                    if command[-1] == '+':
-                        self.extend_commands.append(command[:-1])
-                    else:
-                        self.strict_commands.append(command)
-        except FileNotFoundError:
-            return
+        return self.box.probability(request.msg, extend_p=70, strict_p=90)
 
     def handle(self, request):
         self.deactivate()
         responses = []
         responses_to_choose = []
-        strict_only = False
-        for item in self.answer_table:
-            # read command
-            command = item['question']
-            command_is_extended = bool(command[-1] == '+')
-            command_is_to_choose = bool(command[0] == '/')
-            command_text = command.lower()
-            if command_is_extended:
-                command_text = command_text[:-1]
-            if command_is_to_choose:
-                command_text = command_text[1:]
-
-            if command_is_extended and command_text in request.msg.lower():
-                # extended command
-                if strict_only:
-                    continue
-                else:
-                    pass
-            elif command_text == request.msg.lower():
-                # strict command
-                if strict_only:
-                    pass
-                else:
-                    # refresh
-                    responses = []
-                    responses_to_choose = []
-                    strict_only = True
-            else:
-                continue
+        for i in self.box.match(request.msg):
+            item = self.box.items[i]
+            command_is_to_choose = item['to_choose']
             # add this item to the response list
             text = item['answer_text']
             img = item['answer_img']
@@ -100,6 +133,8 @@ class AutoAnswerSession(Session):
 
 
 class AddAnswerSession(ArgSession):
+    _text_only = False  # 图片回答需要接收图片消息
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '问答库更新'
@@ -119,9 +154,6 @@ class AddAnswerSession(ArgSession):
                                   ask_text='是否有默认的图片回答？（直接回复图片表示有，否则无）')]
         self.default_arg = self.arg_list[0]
 
-    def is_legal_request(self, request):
-        return True
-
     def _add_answer(self):
         with open(BOX_FILE, 'a+', newline='', encoding='utf-8') as f:
             writer = csv.DictWriter(f, fieldnames=['question', 'answer_text', 'answer_img'])
@@ -134,6 +166,7 @@ class AddAnswerSession(ArgSession):
             writer.writerow({'question': self.question,
                              'answer_text': text,
                              'answer_img': img_file})
+        load_answer_box(force=True)  # 写入后立即重新编译问答库
 
     def info(self):
         text = '问题：{}'.format(self.question)
@@ -62,7 +62,7 @@ class ArgSession(Session):
         except IndexError:
             return 0
         else:
-            return self._called_by_command(msg=msg)
+            return self._called_by_command(msg=msg, extend_p=self._extend_p, strict_p=self._strict_p)
 
     def help(self, detail=False):
         help_str = self._default_help()
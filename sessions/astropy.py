@@ -3,12 +3,23 @@ from astropy import units as u
 from astropy.time import Time
 from astropy.coordinates import SkyCoord, EarthLocation, AltAz, get_sun, get_moon
 from astropy.coordinates.name_resolve import NameResolveError
-import matplotlib.pyplot as plt
-import datetime
+import datetime, os, json, threading
 from ..utils import image_filename
+from ..render_service import render
+from ..figures import draw_altitude, draw_polar
+from ..paths import PATHS
+from ..external.ttl_cache import TTLCache
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg, ResponseImg
 
+# 观测点（河北兴隆）
+SITE_LOCATION = EarthLocation(lon=(117+34/60+28.35/3600)*u.deg,
+                              lat=(40+23/60+45.36/3600)*u.deg,
+                              height=900*u.m)
+N_TIMES = 500  # 一晚的时间采样数
+NIGHT_CACHE = TTLCache(max_size=8, ttl=24 * 3600)  # 日期 -> 时间网格、AltAz坐标系、太阳和月亮的高度方位
+STAR_NAME_FILE = os.path.join(PATHS['cache'], 'star_names.json')  # 天体名称 -> (ra, dec)，解析过的名称不再联网
+
 
 class AstroPlotSession(ArgSession):
     def __init__(self, user_id):
@@ -58,66 +69,86 @@ class AstroPlotSession(ArgSession):
         return responses
 
 
+# 天体名称解析的缓存，保存在文件中
+class StarNameCache:
+    def __init__(self, filename=STAR_NAME_FILE):
+        self.filename = filename
+        self._names = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(star_name):
+        return ' '.join(star_name.lower().split())
+
+    def _load(self):
+        if self._names is None:
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    self._names = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._names = {}
+        return self._names
+
+    def get_coord(self, star_name) -> SkyCoord:
+        key = self._key(star_name)
+        with self._lock:
+            radec = self._load().get(key)
+        if radec is not None:
+            return SkyCoord(ra=radec[0]*u.deg, dec=radec[1]*u.deg)
+        source = SkyCoord.from_name(star_name)  # 找不到时为NameResolveError，不缓存
+        with self._lock:
+            names = self._load()
+            names[key] = [source.ra.deg, source.dec.deg]
+            tmp_file = self.filename + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(names, f, ensure_ascii=False)
+            os.replace(tmp_file, self.filename)
+        return source
+
+
+STAR_NAMES = StarNameCache()
+
+
+# 同一晚的时间网格、坐标系和太阳、月亮位置，对所有天体相同
+def get_night(midnight_time):
+    def load():
+        utcoffset = 8*u.hour
+        # utctime = Time('2021-5-22 23:00:00') - utcoffset
+        # source.transform_to(AltAz(obstime=utctime, location=site_loc))
+        midnight = Time(midnight_time) - utcoffset
+        delta_midnight = np.linspace(-12, 12, N_TIMES)*u.hour
+        times = midnight + delta_midnight  # utctime
+        frame = AltAz(obstime=times, location=SITE_LOCATION)
+        return {'delta_midnight': delta_midnight, 'frame': frame,
+                'sun_altazs': get_sun(times).transform_to(frame),
+                'moon_altazs': get_moon(times).transform_to(frame)}
+    return NIGHT_CACHE.get_or_load(midnight_time, load)
+
+
 def get_altitude(star_name, altitude_filename=None, polar_filename=None,
                  days_delta=0):
     midnight_time = (datetime.datetime.today() + datetime.timedelta(days=days_delta+1)).strftime('%Y-%m-%d 00:00:00')
     try:
-        source = SkyCoord.from_name(star_name)
+        source = STAR_NAMES.get_coord(star_name)
     except ValueError:
         return {'observable': False}
-    site_loc = EarthLocation(lon=(117+34/60+28.35/3600)*u.deg,
-                             lat=(40+23/60+45.36/3600)*u.deg,
-                             height=900*u.m)
-    utcoffset = 8*u.hour
-    # utctime = Time('2021-5-22 23:00:00') - utcoffset
-    # source.transform_to(AltAz(obstime=utctime, location=site_loc))
-    midnight = Time(midnight_time) - utcoffset
-    n_times = 500
-    delta_midnight = np.linspace(-12, 12, n_times)*u.hour
-    times = midnight + delta_midnight  # utctime
-    frame = AltAz(obstime=times, location=site_loc)
-    source_altazs = source.transform_to(frame)
-    sun_altazs = get_sun(times).transform_to(frame)
-    moon_altazs = get_moon(times).transform_to(frame)
+    night = get_night(midnight_time)
+    delta_midnight = night['delta_midnight']
+    source_altazs = source.transform_to(night['frame'])
+    sun_altazs = night['sun_altazs']
+    moon_altazs = night['moon_altazs']
 
     if altitude_filename is not None:
-        plt.plot(delta_midnight, sun_altazs.alt, color='r', label='Sun')
-        plt.plot(delta_midnight, moon_altazs.alt, color=[0.75]*3, ls='--', label='Moon')
-        plt.scatter(delta_midnight, source_altazs.alt,
-                    c=source_altazs.az, label=star_name, lw=0, s=8,
-                    cmap='viridis')
-        plt.fill_between(delta_midnight, 0*u.deg, 90*u.deg,
-                         sun_altazs.alt < -0*u.deg, color='0.5', zorder=0)
-        plt.fill_between(delta_midnight, 0*u.deg, 90*u.deg,
-                         sun_altazs.alt < -18*u.deg, color='k', zorder=0)
-        plt.colorbar().set_label('Azimuth [deg]')
-        plt.legend(loc='upper left')
-        # plt.xlim(-12*u.hour, 12*u.hour)
-        plt.xlim(-12, 12)
-        # plt.xticks((np.arange(13)*2-12)*u.hour)
-        plt.xticks(np.arange(13)*2-12)
-        # plt.ylim(0*u.deg, 90*u.deg)
-        plt.ylim(0, 90)
-        plt.xlabel('Hours from EDT Midnight')
-        plt.ylabel('Altitude [deg]')
-        plt.savefig(altitude_filename)
-        plt.close()
+        render(draw_altitude, filename=altitude_filename, star_name=star_name,
+               hours=delta_midnight.to_value(u.hour),
+               sun_alt=sun_altazs.alt.deg, moon_alt=moon_altazs.alt.deg,
+               source_alt=source_altazs.alt.deg, source_az=source_altazs.az.deg)
 
     if polar_filename is not None:
         at_night = sun_altazs.alt < 0*u.deg
-        ax = plt.subplot(111, projection='polar')
-        # projection = 'polar' 指定为极坐标
-        ax.set_rlim(0, 90)
-        ax.plot()
-
-        ax.plot(source_altazs.az.rad[at_night], 90 - source_altazs.alt.deg[at_night], label=star_name)
-        ax.plot(moon_altazs.az.rad[at_night], 90 - moon_altazs.alt.deg[at_night],
-                color=[0.75]*3, ls='--', label='Moon')
-
-        ax.grid(True)  # 是否有网格
-        ax.legend()
-        plt.savefig(polar_filename)
-        plt.close()
+        render(draw_polar, filename=polar_filename, star_name=star_name,
+               source_az=source_altazs.az.rad[at_night], source_zenith=90 - source_altazs.alt.deg[at_night],
+               moon_az=moon_altazs.az.rad[at_night], moon_zenith=90 - moon_altazs.alt.deg[at_night])
 
 
 
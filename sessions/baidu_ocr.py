@@ -5,6 +5,8 @@ from aip import AipOcr
 
 
 class OcrSession(ArgSession):
+    _text_only = False  # 后续消息为图片
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self._max_delta = 3*60
@@ -27,9 +29,6 @@ class OcrSession(ArgSession):
             probabilites.append(10)
         return max(probabilites)
 
-    def is_legal_request(self, request):
-        return True
-
     def internal_handle(self, request):
         self.deactivate()
         img = self.arg_dict['image'].raw_req.img
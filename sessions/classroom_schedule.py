@@ -1,13 +1,136 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
 from ..paths import PATHS
-import requests, datetime, bs4, os, pickle
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from ..webdriver_pool import DRIVER_POOL
+import requests, datetime, bs4, os, pickle, re, threading
+import concurrent.futures
 
 
 CACHE_DIR = PATHS['cache']
 webdriver_dir = PATHS['webdriver']
+CLASSROOM_STORE_FILE = os.path.join(CACHE_DIR, 'classroom_schedules.data')
+CLASSROOM_RETENTION_DAYS = 7  # 保留几天前的查询结果
+CLASSROOM_FILTERS = ['不排课', '室', '房', '运动场', '厅', '礼堂']  # 不是教室的场地
+CLASSROOM_QUERY_URL = 'http://jwjz.ucas.ac.cn/jiaowu/classroom/allclassroomforquery0.asp?term=%s'  # 教室查询页
+
+
+# 按楼的空闲教室索引，建立时筛掉非教室场地，每个楼只计算一次
+class FreeRoomIndex:
+    def __init__(self, schedule_list):
+        self._rooms = [s for s in schedule_list
+                       if not any(f in s['classroom'] for f in CLASSROOM_FILTERS)]
+        self._buildings = {}  # building -> {'morning': [], 'afternoon': [], 'evening': [], 'allday': []}
+        self._lock = threading.Lock()
+        for building in set(re.match(r'\D*', s['classroom']).group() for s in self._rooms):
+            self.get(building)  # 预先计算各楼（教室名中数字前的部分）
+        self.get('')  # 全部教室
+
+    def get(self, building) -> dict:
+        with self._lock:
+            free_rooms = self._buildings.get(building)
+            if free_rooms is None:
+                free_rooms = {'morning': [], 'afternoon': [], 'evening': [], 'allday': []}
+                for schedule in self._rooms:
+                    if building not in schedule['classroom']:
+                        continue
+                    classroom_name = schedule['classroom'].replace(building, '')
+                    if schedule['morning']:
+                        free_rooms['morning'].append(classroom_name)
+                    if schedule['afternoon']:
+                        free_rooms['afternoon'].append(classroom_name)
+                    if schedule['evening']:
+                        free_rooms['evening'].append(classroom_name)
+                    if schedule['morning'] and schedule['afternoon'] and schedule['evening']:
+                        free_rooms['allday'].append(classroom_name)
+                self._buildings[building] = free_rooms
+            return free_rooms
+
+
+# 教室查询缓存，(日期, 校区) -> 教室安排，进程内只读取一次，缓存文件被更新（如定时任务）后重新读取
+class ClassroomStore:
+    def __init__(self, store_file=CLASSROOM_STORE_FILE, retention_days=CLASSROOM_RETENTION_DAYS):
+        self.store_file = store_file
+        self.retention_days = retention_days
+        self._schedules = {}  # (target_date, campus_id) -> schedule_list
+        self._indexes = {}  # (target_date, campus_id) -> FreeRoomIndex
+        self._stat = None
+        self._legacy_checked = False
+        self._lock = threading.Lock()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.store_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _reload(self):
+        stat = self._file_stat()
+        if stat is None:
+            if not self._legacy_checked and self._import_legacy():
+                stat = self._file_stat()
+            else:
+                return
+        if stat != self._stat:
+            with open(self.store_file, 'rb') as f:
+                self._schedules = pickle.load(f)
+            self._indexes = {}
+            self._stat = stat
+
+    # 旧版本的缓存（每次更新一个classroom_*文件），导入后删除
+    def _import_legacy(self) -> bool:
+        self._legacy_checked = True
+        store_name = os.path.basename(self.store_file)
+        legacy_files = sorted(filename for filename in os.listdir(os.path.dirname(self.store_file))
+                              if filename[:10] == 'classroom_' and not filename.startswith(store_name))
+        if not legacy_files:
+            return False
+        results = []
+        for filename in legacy_files:  # 旧的在前，新的覆盖
+            with open(os.path.join(os.path.dirname(self.store_file), filename), 'rb') as f:
+                results += pickle.load(f)
+        self._update(results)
+        for filename in legacy_files:
+            os.remove(os.path.join(os.path.dirname(self.store_file), filename))
+        return True
+
+    def _update(self, results):
+        schedules = dict(self._schedules)
+        for r in results:
+            schedules[(r['target_date'], r['campus_id'])] = r['schedule_list']
+        oldest = datetime.date.today() - datetime.timedelta(days=self.retention_days)
+        schedules = {k: v for k, v in schedules.items() if k[0] >= oldest}  # 删除过期的记录
+        temp_file = f'{self.store_file}.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump(schedules, f)
+        os.replace(temp_file, self.store_file)  # 写完后一次替换，读取时不会读到一半
+        self._schedules = schedules
+        self._indexes = {}
+        self._stat = self._file_stat()
+
+    # results: [{'target_date', 'campus_id', 'schedule_list'}]
+    def update(self, results):
+        with self._lock:
+            self._reload()
+            self._update(results)
+
+    def get(self, target_date, campus_id):
+        with self._lock:
+            self._reload()
+            return self._schedules.get((target_date, campus_id))
+
+    def get_index(self, target_date, campus_id):
+        with self._lock:
+            self._reload()
+            key = (target_date, campus_id)
+            if key not in self._schedules:
+                return None
+            if key not in self._indexes:
+                self._indexes[key] = FreeRoomIndex(self._schedules[key])
+            return self._indexes[key]
+
+
+CLASSROOM_STORE = ClassroomStore()
 
 
 class ClassroomScheduleSession(ArgSession):
@@ -113,6 +236,7 @@ class ScheduleFinder:
         self.campus_id = campus_id  # Yanqi Lake=3, Yuquan Road=1, Zhongguan Village=2
         self.calender = self._get_calender()
         self.schedule_list = []
+        self.free_index = None
         self.enable_cache = enable_cache
         self.cache_dir = CACHE_DIR
         self.webdriver_dir = webdriver_dir
@@ -199,12 +323,8 @@ class ScheduleFinder:
         return bs4.BeautifulSoup(r1.text, 'html.parser')
 
     def _get_soup_with_selenium(self):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-        try:
-            url = f'http://jwjz.ucas.ac.cn/jiaowu/classroom/allclassroomforquery0.asp?term={self.term_id}'
-            driver.get(url=url)
+        with DRIVER_POOL.lease() as driver:  # 使用共用的浏览器，每次都从查询页开始
+            driver.get(url=CLASSROOM_QUERY_URL % self.term_id)
             driver.find_element_by_xpath(f'//input[@name="yq" '
                                          f'and @value="{self.campus_id}"]').click()
             driver.find_element_by_xpath(f'//input[@name="weekname" '
@@ -213,11 +333,6 @@ class ScheduleFinder:
                                          f'and @value="{self.calender["weekday_name"]}"]').click()
             driver.find_element_by_xpath('//input[@name="Submit"]').click()
             soup = bs4.BeautifulSoup(driver.page_source, 'html.parser')
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
         return soup
 
     def _get_tag_list(self):
@@ -233,19 +348,11 @@ class ScheduleFinder:
     def get_schedule_list(self, tag_list=None):
         # read cache
         if self.enable_cache:
-            cache_file_list = []
-            for filename in os.listdir(self.cache_dir):
-                if filename[:10] == 'classroom_':
-                    cache_file_list.append(filename)
-            cache_file_list.sort(reverse=True)  # new_ones_in_the_front
-            for filename in cache_file_list:
-                with open(os.path.join(self.cache_dir, filename), 'rb') as f:
-                    results = pickle.load(f)
-                    for r in results:
-                        if r['target_date'] == self.target_date:
-                            if r['campus_id'] == self.campus_id:
-                                self.schedule_list = r['schedule_list']
-                                return
+            schedule_list = CLASSROOM_STORE.get(target_date=self.target_date, campus_id=self.campus_id)
+            if schedule_list is not None:
+                self.schedule_list = schedule_list
+                self.free_index = CLASSROOM_STORE.get_index(target_date=self.target_date, campus_id=self.campus_id)
+                return
 
         if tag_list is None:
             try:
@@ -256,43 +363,23 @@ class ScheduleFinder:
         for row_tag in tag_list:
             schedule_list.append(self._get_schedule(row_tag))
         self.schedule_list = schedule_list
+        self.free_index = None
 
     def report(self, building='教一楼'):
         if building in ['楼', '全部', 'all', '-']:
             building = ''
         if not self.schedule_list:
-            url = 'http://jwjz.ucas.ac.cn/jiaowu/classroom/allclassroomforquery0.asp?term=%s' % self.term_id
+            url = CLASSROOM_QUERY_URL % self.term_id
             return '空闲教室未找到\n[%s]\n请手动前往：%s' % (self.calender['description'], url)
 
-        morning_list = []
-        afternoon_list = []
-        evening_list = []
-        allday_list = []
-        for schedule in self.schedule_list:
-            filtered = False
-            filters = ['不排课', '室', '房', '运动场', '厅', '礼堂']
-            if building not in schedule['classroom']:
-                filtered = True
-            for f in filters:
-                if f in schedule['classroom']:
-                    filtered = True
-            if filtered:
-                continue
-
-            classroom_name = schedule['classroom'].replace(building, '')
-            if schedule['morning']:
-                morning_list.append(classroom_name)
-            if schedule['afternoon']:
-                afternoon_list.append(classroom_name)
-            if schedule['evening']:
-                evening_list.append(classroom_name)
-            if schedule['morning'] and schedule['afternoon'] and schedule['evening']:
-                allday_list.append(classroom_name)
+        if self.free_index is None:
+            self.free_index = FreeRoomIndex(self.schedule_list)
+        free_rooms = self.free_index.get(building)
 
         return '[%s]的空闲教室\n[%s]\n[上午]：%s\n[下午]：%s\n[晚上]：%s\n[全天]：%s' \
                % (building, self.calender['description'],
-                  self._to_string(morning_list), self._to_string(afternoon_list),
-                  self._to_string(evening_list), self._to_string(allday_list))
+                  self._to_string(free_rooms['morning']), self._to_string(free_rooms['afternoon']),
+                  self._to_string(free_rooms['evening']), self._to_string(free_rooms['allday']))
 
     @staticmethod
     def _to_string(s_list):
@@ -302,17 +389,21 @@ class ScheduleFinder:
         return result[:-2]
 
 
+def _scrape_schedule(target, campus_id):
+    s_finder = ScheduleFinder(target=target, campus_id=campus_id, enable_cache=False)
+    s_finder.get_schedule_list()
+    return {'target_date': target, 'campus_id': campus_id, 'schedule_list': s_finder.schedule_list}
+
+
+# 各日期、校区同时查询，线程数与共用浏览器的数量相同
 def classroom_cache_update(day_start=0, day_finish=2):
-    results = []
+    targets = []
     for day_delta in range(day_start, day_finish+1):
         target = datetime.date.today() + datetime.timedelta(days=day_delta)
         for campus_id in range(1, 4):
-            s_finder = ScheduleFinder(target=target, campus_id=campus_id, enable_cache=False)
-            s_finder.get_schedule_list()
-            results.append({'target_date': target, 'campus_id': campus_id, 'schedule_list': s_finder.schedule_list})
+            targets.append((target, campus_id))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DRIVER_POOL.max_drivers) as executor:
+        results = list(executor.map(lambda t: _scrape_schedule(*t), targets))
     assert len(results) > 0, 'empty results error'
-    with open(os.path.join(CACHE_DIR,
-                           f'classroom_{datetime.date.today().isoformat()}_+{day_start}-{day_finish}'),
-              'wb') as f:
-        pickle.dump(results, f)
+    CLASSROOM_STORE.update(results)
 
@@ -2,11 +2,17 @@ from ..utils import image_filename
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg, ResponseImg
 import numpy as np
+from ..render_service import render
+from ..figures import draw_lines
+from ..external.ttl_cache import TTLCache
 from scipy import integrate
-import matplotlib.pyplot as plt
 import traceback
 
 # 2021-12-14 迁移
+# 红移的积分在ln(1+z)网格上一次累积求出，按宇宙学参数缓存，查询时插值
+Z_GRID_MAX = 1e10  # 网格上限，积分到无穷时用它近似
+Z_GRID_POINTS = 20001  # 网格点数
+COSMO_GRID_CACHE = TTLCache(max_size=64, ttl=24 * 3600)
 
 
 class CosmoPlotSession(ArgSession):
@@ -190,14 +196,40 @@ class ParameterCalculator(PhysicalConstants):
     def h(self, z):  # Hubble parameter at redshift z
         return self.h0 * self._E(z)
 
+    def _params(self):
+        return self.O_m0, self.O_r0, self._O_k0, self.O_l0, self.a0, self.h0
+
+    # integrand从0到z的积分，z可以是数组；z在网格范围内（含无穷）时插值，否则逐个用quad
+    def _integral(self, kind, integrand, z):
+        z = np.asarray(z, dtype=float)
+        if not np.all((z >= 0) & ((z <= Z_GRID_MAX) | np.isposinf(z))):
+            result = np.vectorize(lambda zi: integrate.quad(integrand, 0, zi)[0])(z)
+            return float(result) if result.ndim == 0 else result
+
+        def load():
+            u = np.linspace(0., np.log1p(Z_GRID_MAX), Z_GRID_POINTS)
+            x = np.expm1(u)
+            return u, integrate.cumulative_trapezoid(integrand(x) * (1 + x), u, initial=0)  # dz = (1+z)du
+        u_grid, cumulative = COSMO_GRID_CACHE.get_or_load((type(self).__name__, kind) + self._params(), load)
+        result = np.where(np.isposinf(z), cumulative[-1], np.interp(np.log1p(np.minimum(z, Z_GRID_MAX)),
+                                                                     u_grid, cumulative))
+        return float(result) if result.ndim == 0 else result
+
+    def _t_integrand(self, x):
+        return 1 / ((1 + x) * self.h2SI(self.h(x)))
+
+    def _growth_integrand(self, x):
+        return (1 + x) / self._E(x) ** 3
+
     def t_back(self, z):  # look back time, in seconds
-        return integrate.quad(lambda x: 1 / ((1 + x) * self.h2SI(self.h(x))), 0, z)[0]
+        return self._integral('t', self._t_integrand, z)
 
     def age(self, z):  # integrate dz/((1+z)*H(z)) from z to infinity
-        return integrate.quad(lambda x: 1 / ((1 + x) * self.h2SI(self.h(x))), z, np.inf)[0]
+        return self._integral('t', self._t_integrand, np.inf) - self._integral('t', self._t_integrand, z)
 
     def growth_factor(self, z):  # growing mode of perturbation (fluid) - see 4.7.2 of GalForm&Evo
-        return self.h(z) * integrate.quad(lambda x: (1 + x) / self._E(x) ** 3, z, np.inf)[0]
+        return self.h(z) * (self._integral('growth', self._growth_integrand, np.inf)
+                            - self._integral('growth', self._growth_integrand, z))
 
     def set_k0(self, flat=True):
         if flat:
@@ -222,8 +254,13 @@ class DistanceCalculator(ParameterCalculator):
     def __init__(self):  # all SI
         ParameterCalculator.__init__(self)
 
+    def _comoving_integrand(self, x):
+        return self.c / (self.h2SI(self.h(x)) * self.a0)
+
     def comoving_distance(self, z, z0=0.):  # integrate c*dz/a0*H(z) from 0 to z
-        return integrate.quad(lambda x: self.c / (self.h2SI(self.h(x)) * self.a0), z0, z)[0]
+        if z0 != 0:
+            return integrate.quad(self._comoving_integrand, z0, z)[0]
+        return self._integral('comoving', self._comoving_integrand, z)
 
     def proper_distance(self, z, dc=None):
         if dc is None:
@@ -278,18 +315,13 @@ class PlotFunc:
         rr = dens_r_0 * z_plus_1 ** 4
         ymax = np.max([rm, rl, rr])*10
         ymin = np.min([rm, rl, rr])/10
-        fig, ax = plt.subplots()
-        ax.plot(z_plus_1, rm, label='matter')
-        ax.plot(z_plus_1, rl, label='dark energy')
-        ax.plot(z_plus_1, rr, label='radiation')
-        ax.vlines(z_lm + 1, ymin, ymax, linestyles='--')
-        ax.vlines(z_rm + 1, ymin, ymax, linestyles='--')
-        ax.set(title='Cosmology Density', ylabel=r'Density / $\rm{kg\times m^{-3}}$', xlabel='1+z',
-               xscale='log', yscale='log', xlim=(zmin+1, zmax+1), ylim=(ymin, ymax))
-        ax.legend()
-        ax.grid()
-        fig.tight_layout()
-        plt.savefig(filename)
+        render(draw_lines, filename=filename,
+               lines=[(z_plus_1, rm, {'label': 'matter'}),
+                      (z_plus_1, rl, {'label': 'dark energy'}),
+                      (z_plus_1, rr, {'label': 'radiation'})],
+               vlines=[(z_lm + 1, ymin, ymax), (z_rm + 1, ymin, ymax)],
+               ax_set=dict(title='Cosmology Density', ylabel=r'Density / $\rm{kg\times m^{-3}}$', xlabel='1+z',
+                           xscale='log', yscale='log', xlim=(zmin+1, zmax+1), ylim=(ymin, ymax)))
 
     # 宇宙学距离
     @staticmethod
@@ -300,14 +332,13 @@ class PlotFunc:
                      r"$\rm{D_L}$": dcal.luminosity_distance}
         lg_z_plus_1 = np.arange(np.log10(zmin + 1), np.log10(zmax + 1), 0.01)
         z_plus_1 = 10 ** lg_z_plus_1
-        fig, ax = plt.subplots()
+        dc = dcal.comoving_distance(z_plus_1 - 1)  # 整条曲线一次求出
+        lines = []
         for label, func in distances.items():
-            ax.plot(z_plus_1, np.array(list(map(func, z_plus_1 - 1))) / dcal.pc, label=label)
-        ax.set(title='Cosmology Distance', ylabel=r"Distance / pc", xlabel='1+z', xscale='log', yscale='log')
-        ax.legend()
-        ax.grid()
-        fig.tight_layout()
-        plt.savefig(filename)
+            lines.append((z_plus_1, func(z_plus_1 - 1, dc=dc) / dcal.pc, {'label': label}))
+        render(draw_lines, filename=filename, lines=lines,
+               ax_set=dict(title='Cosmology Distance', ylabel=r"Distance / pc", xlabel='1+z',
+                           xscale='log', yscale='log'))
 
     # 气体Jeans质量
     @staticmethod
@@ -323,13 +354,9 @@ class PlotFunc:
         temp = 1e8
         l_j = dcal.jeans_length_gas(rho=rho, T=temp)
         m_j = dcal.jeans_mass(rho=rho, l_j=l_j) / dcal.m_sun
-        fig, ax = plt.subplots()
-        ax.plot(z_plus_1, m_j)
-        ax.set(title='gas Jeans mass (O_b0=0.0484)', ylabel="Jeans Mass [$M_\odot$]", xlabel='1+z',
-               xscale='log', yscale='log')
-        ax.grid()
-        fig.tight_layout()
-        plt.savefig(filename)
+        render(draw_lines, filename=filename, lines=[(z_plus_1, m_j, {})], legend=False,
+               ax_set=dict(title='gas Jeans mass (O_b0=0.0484)', ylabel="Jeans Mass [$M_\odot$]", xlabel='1+z',
+                           xscale='log', yscale='log'))
 
     # 两种宇宙学的linear growth rate
     @staticmethod
@@ -349,14 +376,10 @@ class PlotFunc:
         lg_z_plus_1 = np.arange(np.log10(zmin + 1), np.log10(zmax + 1), 0.01)
         z_plus_1 = 10 ** lg_z_plus_1
 
-        fig, ax = plt.subplots()
+        lines = []
         for label, universe in {'EdS': cosmo_EdS, 'LCDM': cosmo_LCDM, 'your': cosmo}.items():
             D_0 = universe.growth_factor(0.)
-            ax.plot(z_plus_1, np.array(list(map(universe.growth_factor, z_plus_1 - 1))) / D_0, label=label)
-
-        ax.set(title='D(z) in cosmo', ylabel="linear growth factor D(z)", xlabel='1+z', xscale='log')
-        # plt.yscale('log')
-        ax.legend()
-        ax.grid()
-        fig.tight_layout()
-        plt.savefig(filename)
+            lines.append((z_plus_1, universe.growth_factor(z_plus_1 - 1) / D_0, {'label': label}))
+
+        render(draw_lines, filename=filename, lines=lines,
+               ax_set=dict(title='D(z) in cosmo', ylabel="linear growth factor D(z)", xlabel='1+z', xscale='log'))
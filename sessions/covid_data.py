@@ -1,17 +1,89 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
 from ..paths import PATHS
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import ElementClickInterceptedException
+from ..webdriver_pool import DRIVER_POOL
+from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
 import pandas as pd
 import numpy as np
-import time, os, bs4, datetime, re, json
+import time, os, bs4, datetime, re, json, threading
+import concurrent.futures
 
 CACHE_DIR = PATHS['cache']
 webdriver_dir = PATHS['webdriver']
 N_DAYS_TO_CURE = 21  # 假设无症状感染者康复的天数
 PROVINCE_RECHECK = ['上海', '吉林', '北京', '福建']  # 需要检查无症状感染者的省份
+CLICK_TIMEOUT = 1  # 元素被遮挡时，等待其可以点击的最长时间（秒）
+SNAPSHOT_EXT = '.pkl'  # 缓存格式，pickle保存的DataFrame，读取比Excel快得多
+LEGACY_EXT = '.xlsx'  # 旧的缓存格式，仍可读取
+_SNAPSHOTS = {}  # cache_header -> 该数据源最新的CovidSnapshot，常驻内存
+_CACHE_DIR_MTIME = {}  # cache_header -> 上次查找缓存文件时缓存目录的修改时间
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+# 依次点击（展开）各省份，被遮挡的等到可以点击时再点（显式等待，代替固定的sleep）
+def click_all(driver, elements, skip_texts=()):
+    incomplete_list = []
+    for e in elements:
+        try:
+            e.click()
+        except ElementClickInterceptedException:
+            if e.text not in skip_texts:
+                incomplete_list.append(e)
+    for e in incomplete_list:
+        try:
+            WebDriverWait(driver, CLICK_TIMEOUT, poll_frequency=0.05,
+                          ignored_exceptions=[ElementClickInterceptedException]).until(lambda d: e.click() or True)
+        except TimeoutException:
+            print(f'fail to click {e.text}')
+
+
+# 一份疫情数据，带省份索引，查询时直接取对应的行
+class CovidSnapshot:
+    def __init__(self, df, update_time, filename=None):
+        self.df = df
+        self.update_time = update_time
+        self.filename = filename
+        self.local = df[df['地区'] == '本土病例']
+        self.provinces = {province: df_province for province, df_province in df.groupby('省份', sort=False)}
+
+    def get_province(self, province):
+        return self.provinces.get(province, self.df.iloc[0:0])
+
+
+# 缓存目录中该数据源最新的缓存文件，同一时间的新旧格式都存在时优先新格式
+def _latest_cache_file(cache_header, cache_dir=CACHE_DIR):
+    latest = None
+    for filename in os.listdir(cache_dir):
+        name, ext = os.path.splitext(filename)
+        if name[:len(cache_header) + 1] != f'{cache_header}_' or ext not in [SNAPSHOT_EXT, LEGACY_EXT]:
+            continue
+        key = (name[len(cache_header) + 1:], ext == SNAPSHOT_EXT)
+        if latest is None or key > latest[0]:
+            latest = (key, filename)
+    return None if latest is None else latest[1]
+
+
+# 取得最新的缓存，只在缓存目录有变化、且出现更新的文件时才重新读取
+def load_snapshot(cache_header, cache_dir=CACHE_DIR):
+    with _SNAPSHOT_LOCK:
+        dir_mtime = os.stat(cache_dir).st_mtime_ns
+        snapshot = _SNAPSHOTS.get(cache_header)
+        if snapshot is not None and _CACHE_DIR_MTIME.get(cache_header) == dir_mtime:
+            return snapshot
+        filename = _latest_cache_file(cache_header, cache_dir=cache_dir)
+        if filename is None:
+            return None
+        if snapshot is None or snapshot.filename != filename:
+            path = os.path.join(cache_dir, filename)
+            if filename.endswith(SNAPSHOT_EXT):
+                df = pd.read_pickle(path)
+            else:
+                df = pd.read_excel(path)
+            update_time = os.path.splitext(filename)[0][len(cache_header) + 1:]
+            snapshot = _SNAPSHOTS[cache_header] = CovidSnapshot(df, update_time, filename=filename)
+        _CACHE_DIR_MTIME[cache_header] = dir_mtime
+        return snapshot
 
 
 class CovidDataSession(ArgSession):
@@ -67,9 +139,8 @@ class CovidDataSession(ArgSession):
         # 检查nc参数，获取数据
         if self.arg_dict['no-cache'].called or not self.data_source.load_cache():
             self.data_source.load()
-        else:
-            self.data_source.load_cache()
-        df = self.data_source.df
+        snapshot = self.data_source.get_snapshot()
+        df = snapshot.df
 
         # 检查t参数
         try:
@@ -87,7 +158,7 @@ class CovidDataSession(ArgSession):
             except ValueError:
                 pass
 
-            df_local = df[df['地区'] == '本土病例']
+            df_local = snapshot.local
             try:
                 df_local = df_local.sort_values(sort_by, ascending=False)
             except KeyError:  # not exist
@@ -106,7 +177,7 @@ class CovidDataSession(ArgSession):
             else:
                 responses.append(ResponseMsg(f'【{self.session_type}】空白输出'))
         else:
-            df_new = df[df['省份'] == self.arg_dict['region'].value]
+            df_new = snapshot.get_province(self.arg_dict['region'].value)
             try:
                 df_new = df_new.sort_values(sort_by, ascending=False)
             except KeyError:
@@ -176,25 +247,29 @@ class CovidData:
         self.update_time = None
         self._time_pattern = "%Y-%m-%d-%H-%M-%S"
         self.df = None
+        self._snapshot = None
 
+    # 缓存为pickle保存的DataFrame，写入后同时更新内存中的缓存
     def save_cache(self):
-        filename = os.path.join(CACHE_DIR,
-                                f'{self.cache_header}_{self.update_time}.xlsx')
-        self.df.to_excel(filename, index=False)
+        filename = f'{self.cache_header}_{self.update_time}{SNAPSHOT_EXT}'
+        self.df.to_pickle(os.path.join(self.cache_dir, filename))
+        with _SNAPSHOT_LOCK:
+            _SNAPSHOTS[self.cache_header] = CovidSnapshot(self.df, self.update_time, filename=filename)
 
     def load_cache(self):
-        cache_file_list = []
-        for filename in os.listdir(self.cache_dir):
-            if filename[:len(self.cache_header)] == self.cache_header:
-                cache_file_list.append(filename)
-        cache_file_list.sort(reverse=True)  # new ones in the front
-        if cache_file_list:
-            filename = cache_file_list[0]
-            self.df = pd.read_excel(os.path.join(self.cache_dir, filename))
-            self.update_time = filename.replace(f'{self.cache_header}_', '').replace('.xlsx', '')
-            return True
-        else:
+        snapshot = load_snapshot(self.cache_header, cache_dir=self.cache_dir)
+        if snapshot is None:
             return False
+        self._snapshot = snapshot
+        self.df = snapshot.df
+        self.update_time = snapshot.update_time
+        return True
+
+    # 当前数据的CovidSnapshot（带省份索引），缓存中读取的数据直接共用
+    def get_snapshot(self):
+        if self._snapshot is None or self._snapshot.df is not self.df:
+            self._snapshot = CovidSnapshot(self.df, self.update_time)
+        return self._snapshot
 
     def load(self):
         self._get_dataframe(self._get_soup_with_selenium())
@@ -209,54 +284,18 @@ class CovidData:
             return delta.days
 
     def _get_soup_with_selenium(self):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-
-        try:
+        with DRIVER_POOL.lease() as driver:
             driver.get('https://voice.baidu.com/act/newpneumonia/newpneumonia')
             driver.find_element_by_xpath('//div[@id="nationTable"]/div/span').click()
 
             driver.find_element_by_id('fixedTableHeader').click()  # move to location
 
             provinces = list(driver.find_elements_by_xpath('//div[@id="nationTable"]/table/tbody/tr/td/div/span[2]/..'))
-            incomplete_list = []
-
-            for i, p in enumerate(provinces):
-                try:
-                    p.click()
-                except ElementClickInterceptedException:
-                    if p.text not in ['香港', '澳门', '台湾']:
-                        incomplete_list.append(i)
-                        print(f'fail to click {p.text}')
-
-            retries = 5
-
-            while incomplete_list:
-                if retries > 0:
-                    print(f'retry: {incomplete_list}')
-                    time.sleep(0.2)
-                    retries -= 1
-                else:
-                    print('max retries, pass')
-                    break
-                new_incomplete = []
-                for i in incomplete_list:
-                    try:
-                        provinces[i].click()
-                    except ElementClickInterceptedException:
-                        new_incomplete.append(i)
-                        print(f'fail to click {provinces[i].text}')
-                incomplete_list = new_incomplete
+            click_all(driver, provinces, skip_texts=['香港', '澳门', '台湾'])
 
             s = driver.page_source
 
             soup = bs4.BeautifulSoup(s, 'html.parser')
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
         return soup
 
     def _get_dataframe(self, soup):
@@ -298,13 +337,7 @@ class CovidData:
                     records.append(current_record)
 
         # 更新部分地区无症状数据
-        for region in PROVINCE_RECHECK:
-            data_dict = self._get_region_data(region=region)
-            infections = self._get_infections_from_data(data_dict=data_dict,
-                                                        table_heads=table_head,
-                                                        n_days=N_DAYS_TO_CURE)
-            if infections is not None:
-                records.append(infections)
+        records += self._recheck_regions(table_head=table_head)
 
         # 计算本土病例
         local_data = {}
@@ -333,24 +366,28 @@ class CovidData:
 
         self.df = df
 
+    # 同时获取PROVINCE_RECHECK中各地区的无症状数据，按原顺序返回
+    def _recheck_regions(self, table_head):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DRIVER_POOL.max_drivers) as executor:
+            data_list = list(executor.map(lambda region: self._get_region_data(region=region), PROVINCE_RECHECK))
+        records = []
+        for data_dict in data_list:
+            infections = self._get_infections_from_data(data_dict=data_dict,
+                                                        table_heads=table_head,
+                                                        n_days=N_DAYS_TO_CURE)
+            if infections is not None:
+                records.append(infections)
+        return records
+
     # 获取地区页面的数据
     def _get_region_data(self, region='上海'):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-
-        try:
+        with DRIVER_POOL.lease() as driver:
             # driver.get('https://voice.baidu.com/act/newpneumonia/newpneumonia')
             driver.get(f'https://voice.baidu.com/newpneumonia/getv2?'
                        f'from=mola-virus&stage=publish&target=trend&isCaseIn=1&area={region}')
 
             res = re.search(r'{"status":.*]}', driver.page_source)
             data = json.loads(res.group())
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
         return data
 
     # 从地区页面数据获取无症状感染数
@@ -380,51 +417,16 @@ class CovidDataTencent(CovidData):
         self.cache_header = 'covid-data-tencent'
 
     def _get_soup_with_selenium(self):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-
-        try:
+        with DRIVER_POOL.lease() as driver:
             driver.get('https://news.qq.com/zt2020/page/feiyan.htm#/')
 
             provinces = list(driver.find_elements_by_xpath('/html/body/div[1]/div[2]/div[4]/'
                                                            'div[3]/table[2]/tbody/tr[1]/th/p[1]/span'))
-            incomplete_list = []
-
-            for i, p in enumerate(provinces):
-                try:
-                    p.click()
-                except ElementClickInterceptedException:
-                    incomplete_list.append(i)
-                    print(f'fail to click {p.text}')
-
-            retries = 5
-
-            while incomplete_list:
-                if retries > 0:
-                    print(f'retry: {incomplete_list}')
-                    time.sleep(0.2)
-                    retries -= 1
-                else:
-                    print('max retries, pass')
-                    break
-                new_incomplete = []
-                for i in incomplete_list:
-                    try:
-                        provinces[i].click()
-                    except ElementClickInterceptedException:
-                        new_incomplete.append(i)
-                        print(f'fail to click {provinces[i].text}')
-                incomplete_list = new_incomplete
+            click_all(driver, provinces)
 
             s = driver.page_source
 
             soup = bs4.BeautifulSoup(s, 'html.parser')
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
         return soup
 
     def _get_dataframe(self, soup):
@@ -465,13 +467,7 @@ class CovidDataTencent(CovidData):
                 records.append(current_record[:-1])  # 跳过详情列
 
         # 更新部分地区无症状数据
-        for region in PROVINCE_RECHECK:
-            data_dict = self._get_region_data(region=region)
-            infections = self._get_infections_from_data(data_dict=data_dict,
-                                                        table_heads=table_head,
-                                                        n_days=N_DAYS_TO_CURE)
-            if infections is not None:
-                records.append(infections)
+        records += self._recheck_regions(table_head=table_head)
 
         # 计算本土病例
         local_data = {}
@@ -498,20 +494,11 @@ class CovidDataTencent(CovidData):
 
     # 获取地区页面的数据
     def _get_region_data(self, region='上海'):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-
-        try:
+        with DRIVER_POOL.lease() as driver:
             driver.get(f'https://api.inews.qq.com/newsqa/v1/query/pubished/daily/list?province={region}')
 
             res = re.search(r'{"ret":.*]}', driver.page_source)
             data = json.loads(res.group())
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
         return data
 
     # 从地区页面数据获取无症状感染数
@@ -549,22 +536,12 @@ class CovidDataTencentAdvanced(CovidData):
     def _get_data_advanced(self):
 
         # 从selenium获取tree_data
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-
-        try:
+        with DRIVER_POOL.lease() as driver:
             driver.get('https://api.inews.qq.com/newsqa/v1'
                        '/query/inner/publish/modules/list?modules=statisGradeCityDetail,diseaseh5Shelf')
             data = json.loads(re.search('{"ret".*}', driver.page_source).group())
             tree_data = data['data']['diseaseh5Shelf']['areaTree']
 
-        except Exception as e:
-            driver.quit()
-            raise e
-        else:
-            driver.quit()
-
         # tree data组织如下
         # root为国，下一级为省，再下一级为地区
         # 每个节点有三个properties
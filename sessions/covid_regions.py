@@ -1,14 +1,158 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
 from ..paths import PATHS
-import os, pickle, datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from ..webdriver_pool import DRIVER_POOL
+import os, pickle, datetime, threading
 from selenium.common.exceptions import StaleElementReferenceException
 
 
 CACHE_DIR = PATHS['cache']
 webdriver_dir = PATHS['webdriver']
+_REGION_BOOKS = {}  # cache_header -> 最新的RegionBook，常驻内存
+_CACHE_DIR_MTIME = {}  # cache_header -> 上次查找缓存文件时缓存目录的修改时间
+_REGION_BOOK_LOCK = threading.Lock()
+
+
+# 风险区域表（地区 -> 风险区列表），带地区名的字索引
+# 索引中包含地区名的单字和相邻两字，查找时先按关键词取交集，再确认关键词在地区名中
+class RegionBook:
+    def __init__(self, book=None):
+        self.book = {}
+        self._order = {}  # 地区 -> 加入顺序，查找结果按原顺序输出
+        self._index = {}  # 单字/两字 -> 地区集合
+        self._counter = 0
+        self._lock = threading.Lock()
+        for key, areas in (book or {}).items():
+            self._add(key, areas)
+
+    @staticmethod
+    def _grams(text):
+        return set(text) | {text[i:i+2] for i in range(len(text) - 1)}
+
+    def _add(self, key, areas):
+        self.book[key] = list(areas)
+        self._order[key] = self._counter
+        self._counter += 1
+        for gram in self._grams(key):
+            self._index.setdefault(gram, set()).add(key)
+
+    def _remove(self, key):
+        del self.book[key]
+        del self._order[key]
+        for gram in self._grams(key):
+            keys = self._index[gram]
+            keys.discard(key)
+            if not keys:
+                del self._index[gram]
+
+    # 地区名中包含region_keyword的地区
+    def find(self, region_keyword) -> list:
+        with self._lock:
+            if region_keyword == '':
+                return [(key, list(areas)) for key, areas in self.book.items()]
+            if len(region_keyword) == 1:
+                grams = [region_keyword]
+            else:
+                grams = [region_keyword[i:i+2] for i in range(len(region_keyword) - 1)]
+            candidates = None
+            for gram in sorted(set(grams), key=lambda g: len(self._index.get(g, ()))):  # 从最少的开始取交集
+                keys = self._index.get(gram)
+                if not keys:
+                    return []
+                candidates = set(keys) if candidates is None else candidates & keys
+            keys = [key for key in candidates if region_keyword in key]
+            keys.sort(key=lambda key: self._order[key])
+            return [(key, list(self.book[key])) for key in keys]
+
+    # 更新为new_book，只改动有变化的地区，返回变化：{'added': {地区: [新增风险区]}, 'removed': {地区: [解除风险区]}}
+    def apply(self, new_book: dict) -> dict:
+        changes = {'added': {}, 'removed': {}}
+        with self._lock:
+            for key in list(self.book.keys()):
+                if key not in new_book:
+                    changes['removed'][key] = self.book[key]
+                    self._remove(key)
+            for key, areas in new_book.items():
+                old_areas = self.book.get(key)
+                if old_areas is None:
+                    changes['added'][key] = list(areas)
+                    self._add(key, areas)
+                elif old_areas != areas:
+                    added = [a for a in areas if a not in old_areas]
+                    removed = [a for a in old_areas if a not in areas]
+                    if added:
+                        changes['added'][key] = added
+                    if removed:
+                        changes['removed'][key] = removed
+                    self.book[key] = list(areas)
+        return changes
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {key: list(areas) for key, areas in self.book.items()}
+
+
+# 缓存文件按日期命名，取最新的
+def _latest_cache_file(cache_header, cache_dir=CACHE_DIR):
+    cache_file_list = [filename for filename in os.listdir(cache_dir)
+                       if filename[:len(cache_header) + 1] == f'{cache_header}_' and not filename.endswith('.tmp')]
+    return max(cache_file_list) if cache_file_list else None
+
+
+# 缓存文件的(文件名, 修改时间, 大小)，同一天多次更新会改写同名文件，只比较文件名不够
+def _cache_file_stat(cache_dir, filename):
+    stat = os.stat(os.path.join(cache_dir, filename))
+    return filename, stat.st_mtime_ns, stat.st_size
+
+
+# 取得最新的风险区域表，只在缓存目录有变化、且最新的文件被更新过时才重新读取
+def load_region_book(cache_header, cache_dir=CACHE_DIR):
+    with _REGION_BOOK_LOCK:
+        dir_mtime = os.stat(cache_dir).st_mtime_ns
+        book, book_stat = _REGION_BOOKS.get(cache_header, (None, None))
+        if book is not None and _CACHE_DIR_MTIME.get(cache_header) == dir_mtime:
+            return book
+        filename = _latest_cache_file(cache_header, cache_dir=cache_dir)
+        if filename is None:
+            return None
+        file_stat = _cache_file_stat(cache_dir, filename)
+        if book is None or book_stat != file_stat:
+            with open(os.path.join(cache_dir, filename), 'rb') as f:
+                book = RegionBook(pickle.load(f))
+            _REGION_BOOKS[cache_header] = (book, file_stat)
+        _CACHE_DIR_MTIME[cache_header] = dir_mtime
+        return book
+
+
+# 最近一次更新的变化保存在缓存目录中，与风险区域表放在一起，各进程（如订阅所在的进程）都能读取
+def _changes_file(cache_header, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f'{cache_header}-changes.data')
+
+
+# 最近一次更新的变化：{'filename': 更新后的缓存文件, 'update_time': 更新时间, 'changes': 见RegionBook.apply}
+def load_changes(cache_header, cache_dir=CACHE_DIR):
+    try:
+        with open(_changes_file(cache_header, cache_dir=cache_dir), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# 只保留地区名中包含region_keyword的变化
+def filter_changes(changes: dict, region_keyword) -> dict:
+    return {change_type: {key: areas for key, areas in regions.items() if region_keyword in key}
+            for change_type, regions in changes.items()}
+
+
+# 变化的文字说明
+def format_changes(changes: dict) -> str:
+    msg = ''
+    for change_type, title in [('added', '新增'), ('removed', '解除')]:
+        for key, areas in changes[change_type].items():
+            msg += f'[{title}][{key}]\n'
+            for i, area in enumerate(areas):
+                msg += f'{i+1}. {area}\n'
+    return msg[:-1]
 
 
 class CovidRiskSession(ArgSession):
@@ -22,14 +166,19 @@ class CovidRiskSession(ArgSession):
                                   required=True, get_next=True,
                                   ask_text='要查找的区域（省市级别）'),
                          Argument(key='no-cache', alias_list=['-nc'],
-                                  help_text='不启用缓存，需要搜索更长时间')
+                                  help_text='不启用缓存，需要搜索更长时间'),
+                         Argument(key='changes', alias_list=['-ch'],
+                                  help_text='只列出最近一次更新中新增和解除的风险区，可用于订阅')
                          ]
         self.default_arg = self.arg_list[0]
         self.newser = CovidNews()
-        self.detail_description = '举例，发送“risk -r 福建”，查找福建的中高风险区。'
+        self.detail_description = '举例，发送“risk -r 福建”，查找福建的中高风险区。\n' \
+                                  '订阅变化：订阅 -hr 9 -msg "risk -r 福建 -ch"'
 
     def internal_handle(self, request):
         self.deactivate()
+        if self.arg_dict['changes'].called:
+            return self._report_changes()
         if self.arg_dict['no-cache'].called or not self.newser.load_cache():
             self.newser.load()
         region_keyword = self.arg_dict["region"].value.replace('中国', '').replace('全国', '')
@@ -39,6 +188,18 @@ class CovidRiskSession(ArgSession):
         else:  # empty
             return ResponseMsg(f'【{self.session_type}】未找到该地区风险区数据。')
 
+    def _report_changes(self):
+        record = load_changes(self.newser.cache_header, cache_dir=self.newser.cache_dir)
+        if record is None:
+            return ResponseMsg(f'【{self.session_type}】暂无风险区更新记录。')
+        region_keyword = self.arg_dict["region"].value.replace('中国', '').replace('全国', '')
+        msg = format_changes(filter_changes(record['changes'], region_keyword))
+        update_time = record['update_time'].strftime('%Y-%m-%d %H:%M')
+        if msg:
+            return ResponseMsg(f'【{self.session_type}】{update_time}更新的变化\n{msg}')
+        else:
+            return ResponseMsg(f'【{self.session_type}】{update_time}更新后该地区风险区无变化。')
+
 
 class CovidRiskUpdateSession(ArgSession):
     def __init__(self, user_id):
@@ -53,43 +214,51 @@ class CovidRiskUpdateSession(ArgSession):
 
     def internal_handle(self, request):
         self.deactivate()
-        covid_region_cache_update()
-        return ResponseMsg(f'【{self.session_type}】done')
+        changes = covid_region_cache_update()
+        n_added = sum(len(areas) for areas in changes['added'].values())
+        n_removed = sum(len(areas) for areas in changes['removed'].values())
+        return ResponseMsg(f'【{self.session_type}】done，新增{n_added}处，解除{n_removed}处')
 
 
 class CovidNews:
     def __init__(self):
         self.webdriver_dir = webdriver_dir
         self.region_book = {}
+        self.book = RegionBook()
         self.cache_header = 'covid-region'
         self.cache_dir = CACHE_DIR
 
-    def save_cache(self):
-        print(self.region_book)
-        with open(os.path.join(CACHE_DIR,
-                               f'{self.cache_header}_{datetime.date.today().isoformat()}'),
-                  'wb') as f:
-            pickle.dump(self.region_book, f)
+    # 保存后同时更新内存中的风险区域表；changes为本次更新的变化，一并保存
+    def save_cache(self, changes=None):
+        filename = f'{self.cache_header}_{datetime.date.today().isoformat()}'
+        cache_file = os.path.join(self.cache_dir, filename)
+        with open(f'{cache_file}.tmp', 'wb') as f:
+            pickle.dump(self.book.to_dict(), f)
+        os.replace(f'{cache_file}.tmp', cache_file)  # 同一天的更新改写同名文件，写完后一次替换
+        if changes is not None:
+            changes_file = _changes_file(self.cache_header, cache_dir=self.cache_dir)
+            with open(f'{changes_file}.tmp', 'wb') as f:
+                pickle.dump({'filename': filename, 'update_time': datetime.datetime.now(), 'changes': changes}, f)
+            os.replace(f'{changes_file}.tmp', changes_file)  # 写完后一次替换，读取时不会读到一半
+        with _REGION_BOOK_LOCK:
+            _REGION_BOOKS[self.cache_header] = (self.book, _cache_file_stat(self.cache_dir, filename))
 
     def load_cache(self):
-        cache_file_list = []
-        for filename in os.listdir(self.cache_dir):
-            if filename[:len(self.cache_header)] == self.cache_header:
-                cache_file_list.append(filename)
-        cache_file_list.sort(reverse=True)  # new ones in the front
-        if cache_file_list:
-            with open(os.path.join(self.cache_dir, cache_file_list[0]), 'rb') as f:
-                self.region_book = pickle.load(f)
-            return True
-        else:
+        book = load_region_book(self.cache_header, cache_dir=self.cache_dir)
+        if book is None:
             return False
+        self.book = book
+        return True
 
+    # 从网页获取，region_book为本次获取的结果
     def load(self):
+        self.region_book = {}
+        self._load_region_book()
+        self.book = RegionBook(self.region_book)
+
+    def _load_region_book(self):
         url = 'http://bmfw.www.gov.cn/yqfxdjcx/risk.html'
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-        try:
+        with DRIVER_POOL.lease() as driver:
             driver.get(url)
             # 防止元素被遮挡
             driver.set_window_size(1920, 1080)
@@ -123,22 +292,21 @@ class CovidNews:
                 update_book(level=level)
                 if level == 'h':
                     driver.find_element_by_xpath('//div[@class="r-middle"]').click()
-            driver.quit()
-        except Exception as e:
-            driver.quit()
-            raise e
 
     def get_region(self, region_keyword):
         msg = ''
-        for key in self.region_book:
-            if region_keyword in key:
-                msg += f'[{key}]\n'
-                for i, area in enumerate(self.region_book[key]):
-                    msg += f'{i+1}. {area}\n'
+        for key, areas in self.book.find(region_keyword):
+            msg += f'[{key}]\n'
+            for i, area in enumerate(areas):
+                msg += f'{i+1}. {area}\n'
         return msg[:-1]
 
 
+# 在上一次的风险区域表上更新，返回变化（同时保存到缓存目录，见load_changes），订阅时可只推送变化的部分
 def covid_region_cache_update():
     cns = CovidNews()
-    cns.load()
-    cns.save_cache()
\ No newline at end of file
+    cns._load_region_book()
+    cns.load_cache()  # 没有缓存时从空表开始
+    changes = cns.book.apply(cns.region_book)
+    cns.save_cache(changes=changes)
+    return changes
\ No newline at end of file
@@ -1,16 +1,16 @@
 from ..responses import ResponseMsg, ResponseCQFunc
-from ..permissions import get_permissions
 from .general import Session
 
 
 class CQCommandSession(Session):
+    permissions_key = 'super'
+
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self._max_delta = 30
         self.session_type = 'CQ控制台'
         self.strict_commands = ['command', 'cmd', 'console', '控制台', '命令']
         self.description = '使用onebot标准（github.com/botuniverse/onebot）的API控制机器人'
-        self.permissions = get_permissions().get('super', {})
         self.is_first_time = True
         self.func_name = ''
         self.kwargs = {}
@@ -32,12 +32,13 @@ class CQCommandSession(Session):
 
 
 class CQRebootSession(Session):
+    permissions_key = 'super'
+
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self._max_delta = 3
         self.session_type = 'CQ重启程序'
         self.strict_commands = ['restart', 'reboot', '重启']
-        self.permissions = get_permissions().get('super', {})
 
     def handle(self, request):
         self.deactivate()
@@ -1,6 +1,7 @@
 from ..responses import ResponseMsg, ResponseImg
 from ..version_description import DESCRIPTION, VERSION_LIST, INTRODUCTION
 from ..paths import PATHS
+from ..permissions import has_permission
 import datetime, os, csv
 
 DEFAULT_WAIT = 10
@@ -10,10 +11,17 @@ DATA_DIR = PATHS['data']
 
 # 基本的Session类，默认功能是复读机
 class Session:
+    # 类级别的唤起声明，分拣中心据此判断唤起率，不需要实例化Session（见session_router）
+    _extend_p = 100  # 消息包含extend command时的唤起率
+    _strict_p = 100  # 消息等于strict command时的唤起率
+    _text_only = True  # 只响应文本request
+    permissions_key = None  # 权限类型（permissions.xlsx中的type），设置后按权限文件判断权限
+
     def __init__(self, user_id):
         self._active = True
         self._last_activity = datetime.datetime.now()  # 上次活动时间
         self.user_id = user_id
+        self.platform = None  # 所在平台，由分拣中心创建Session后填写
         self.session_id = ''
         self.session_type = 'general'
         self.description = ''
@@ -47,7 +55,7 @@ class Session:
 
     # 处理这个Request时，本Session的唤起率/优先级（最大值100，大的Session优先）
     def probability_to_call(self, request):
-        return self._called_by_command(request=request)
+        return self._called_by_command(request=request, extend_p=self._extend_p, strict_p=self._strict_p)
 
     # 默认session在特定command下100%唤起
     # 可传入Request，也可直接传入string
@@ -66,7 +74,9 @@ class Session:
 
     # 判断这个request是否符合Session所需
     def is_legal_request(self, request):
-        return self._permission(request=request) and self._text_request_only(request=request)
+        if self._text_only and not self._text_request_only(request=request):
+            return False
+        return self._permission(request=request)
 
     # 默认session只响应文本request，这个方法供它们调用
     def _text_request_only(self, request):
@@ -74,19 +84,9 @@ class Session:
 
     # 在有权限要求的情况下，可能返回false
     def _permission(self, request):
-        if self.permissions:
-            try:
-                id_list = self.permissions[request.platform]
-                if not id_list:  # empty list, permission granted anyway
-                    return True
-                elif self.user_id in id_list:
-                    return True
-                else:  # id not in permission list
-                    return False
-            except KeyError:  # platform not in permission
-                return False
-        else:
-            return True
+        if self.permissions_key is not None:
+            return has_permission(self.permissions_key, request.platform, self.user_id, default=True)
+        return check_permission(permissions=self.permissions, platform=request.platform, user_id=self.user_id)
 
     # 处理传入的request，并返回response序列
     def handle(self, request):
@@ -104,7 +104,7 @@ class Session:
     # 简短描述
     def brief_help(self):
         help_text = '[%s' % self.session_type
-        if self.permissions:
+        if self.permissions or self.permissions_key:
             help_text += '*'
         help_text += ']: '
         if self._list_commands:
@@ -122,7 +122,7 @@ class Session:
 
     def _default_help(self):
         help_text = '[插件名] %s' % self.session_type
-        if self.permissions:
+        if self.permissions or self.permissions_key:
             help_text += ' (受限)'
         if self._list_commands:
             if self.extend_commands or self.strict_commands:
@@ -139,6 +139,23 @@ class Session:
         return help_text
 
 
+# 权限判断，permissions内容为 platform: id_list，空序列表示全部通过
+def check_permission(permissions, platform, user_id):
+    if permissions:
+        try:
+            id_list = permissions[platform]
+            if not id_list:  # empty list, permission granted anyway
+                return True
+            elif user_id in id_list:
+                return True
+            else:  # id not in permission list
+                return False
+        except KeyError:  # platform not in permission
+            return False
+    else:
+        return True
+
+
 class RepeatSession(Session):
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
@@ -169,14 +186,14 @@ class RepeatSession(Session):
 
 
 class EchoSession(Session):
+    _extend_p = 80
+    _strict_p = 0
+
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self.extend_commands = ['echo', '回声']
         self.session_type = '回声'
 
-    def probability_to_call(self, request):
-        return self._called_by_command(request=request, extend_p=80, strict_p=0)
-
     def handle(self, request):
         self.deactivate()
         msg = request.msg
@@ -1,11 +1,12 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
-from ..permissions import get_permissions
 from ..server_config import FLASK_PORTS
 import re, subprocess, os
 
 
 class Ipv6AddrSession(ArgSession):
+    permissions_key = 'Ipv6AddrSession'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = 'ipv6地址'
@@ -18,7 +19,6 @@ class Ipv6AddrSession(ArgSession):
                                   help_text='返回ipconfig全文')
                          ]
         self.default_arg = None
-        self.permissions = get_permissions().get('Ipv6AddrSession', {})
 
     def internal_handle(self, request):
         self.deactivate()
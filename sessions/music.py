@@ -1,10 +1,9 @@
 from .argument import Argument, ArgSession
 from ..responses import ResponseMusic, ResponseMsg
 from ..paths import PATHS
+from ..webdriver_pool import DRIVER_POOL
 import re, requests
-from selenium import webdriver
 import urllib
-from selenium.webdriver.chrome.options import Options
 
 # 2021-12-12: 支持api，优化点歌
 webdriver_dir = PATHS['webdriver']
@@ -68,10 +67,7 @@ class MusicSession(ArgSession):
 # 爬虫版本，废弃不用
 def search_songs(search_str, webdriver_dir=webdriver_dir):
     url = f'https://music.163.com/#/search/m/?s={urllib.parse.quote(search_str)}&type=1'
-    try:
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=webdriver_dir)
+    with DRIVER_POOL.lease() as driver:
         driver.get(url)
         driver.switch_to.frame('g_iframe')
         raw_list = driver.find_elements_by_xpath('//div[@class="srchsongst"]//div[@class="td w0"]'
@@ -85,12 +81,8 @@ def search_songs(search_str, webdriver_dir=webdriver_dir):
                 music_id = m.group(1)
                 new_list.append({'name': name, 'link': song_link,
                                  'music_id': music_id, 'platform': '163'})
-        driver.quit()
         print(new_list)
         return new_list
-    except Exception as e:
-        driver.quit()
-        raise e
 
 
 # 2021-12-12: 直接调用api
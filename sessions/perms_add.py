@@ -1,6 +1,6 @@
 from ..responses import ResponseMsg
 from .argument import ArgSession
-from ..permissions import PERM_FILE, PERM_KEYS, get_permissions
+from ..permissions import PERM_FILE, PERM_KEYS, invalidate_permissions
 from ..external.record_table import RecordTable, RecordNotFoundError
 import pandas as pd
 import os
@@ -58,17 +58,19 @@ class AddPermissionSession(ArgSession):
 
         dfl.append(new_item)
         pd.DataFrame(dfl).to_excel(PERM_FILE, index=False)
+        invalidate_permissions()
 
         return ResponseMsg(f'【{self.session_type}】权限添加成功：\n{new_item}')
 
 
 class DelPermissionSession(ArgSession):
+    permissions_key = 'super'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '删除权限条目'
         self._max_delta = 60
         self.strict_commands = ['删除权限']
-        self.permissions = get_permissions().get('super', {})
         self.add_arg(key='n_items', alias_list=['-n'],
                      required=False, get_next=True,
                      default_value=10,
@@ -105,6 +107,7 @@ class DelPermissionSession(ArgSession):
         else:  # 删除条目
             try:
                 d_del = self.record_table.pop_by_index(index=request.msg, from_new=True)
+                invalidate_permissions()
             except ValueError:
                 self.deactivate()
                 return ResponseMsg(f'【{self.session_type}】退出')
@@ -122,7 +125,8 @@ class DelPermissionSession(ArgSession):
 
 class PermissionTable(RecordTable):
     def __init__(self):
-        RecordTable.__init__(self, table_file=PERM_FILE, string_cols=['user_id'])
+        # 权限表需要手动编辑，并由permissions模块直接读取，仍使用Excel
+        RecordTable.__init__(self, table_file=PERM_FILE, string_cols=['user_id'], backend='excel')
 
     @staticmethod
     def list_single_record(record) -> str:
@@ -2,12 +2,12 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg, ResponseImg
 from ..utils import image_url_to_path, format_filename
-from ..permissions import get_permissions
 from ..external.answer_book_data import ANSWER_BOOK
 from ..external.slscq import Slscq
 from ..external.slscq_data import SLSCQ_DATA
+from ..render_service import render
+from ..figures import draw_focus_cube
 import random, requests, os
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -64,6 +64,8 @@ class BookOfAnswersSession(ArgSession):
 # https://github.com/MeetWq/mybot/blob/master/src/plugins/setu/data_source.py
 # 2021-12-12: 创建
 class WebImgSession(ArgSession):
+    permissions_key = 'WebImgSession'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '网图'
@@ -79,7 +81,6 @@ class WebImgSession(ArgSession):
                                   required=False, get_next=False,
                                   help_text='直接获取url')
                          ]
-        self.permissions = get_permissions().get('WebImgSession', {})
         self.default_arg = self.arg_list[0]
 
     def internal_handle(self, request):
@@ -156,22 +157,7 @@ class FocusCubeSession(ArgSession):
         yy = np.arange(ny)
         v = np.arange(nx * ny) + 1
         random.shuffle(v)
-        fig, ax = plt.subplots(1, 1, figsize=[0.6 * nx, 0.6 * ny])
-        plt_kwargs = {'horizontalalignment': 'center',
-                      'verticalalignment': 'center'}
-
-        i = 0
-        for x in xx + 0.5:
-            for y in yy + 0.5:
-                ax.text(x, y, v[i], **plt_kwargs)
-                i += 1
-
-        ax.set(xlim=(0, nx), ylim=(0, ny),
-               xticks=xx, xticklabels=[],
-               yticks=yy, yticklabels=[])
-        ax.grid()
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_focus_cube, filename=filename, figsize=[0.6 * nx, 0.6 * ny], xx=xx, yy=yy, v=v)
 
 
 # 原创，使用https://github.com/ASoulCnki/.github/tree/master/api
@@ -11,6 +11,8 @@ import qrcode
 
 
 class DeCodeSession(ArgSession):
+    _text_only = False  # 后续消息为图片
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self._max_delta = 3*60
@@ -22,9 +24,6 @@ class DeCodeSession(ArgSession):
                                   ask_text='等待图片传输',
                                   help_text='接收图片参数，用于扫描')]
 
-    def is_legal_request(self, request):
-        return True
-
     def internal_handle(self, request):
         self.deactivate()
         img = self.arg_dict['image'].raw_req.img
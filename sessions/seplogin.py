@@ -2,9 +2,8 @@ from .argument import ArgSession, Argument
 from ..responses import ResponseMsg, ResponseImg
 from ..utils import format_filename
 from ..paths import PATHS
+from ..webdriver_pool import DRIVER_POOL
 import requests, bs4
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
 webdriver_dir = PATHS['webdriver']
 
@@ -180,10 +179,7 @@ class SepLogin:
         raise Exception('fail to get ehall cookies')
 
     def update_cookie(self, url, domain=".ucas.ac.cn"):
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        driver = webdriver.Chrome(chrome_options=chrome_options, executable_path=self.webdriver_dir)
-        try:
+        with DRIVER_POOL.lease(discard=True) as driver:  # 带有登录cookie，用完后关闭
             driver.implicitly_wait(1)  # 等待3秒
             driver.get(url)
             driver.implicitly_wait(0.5)
@@ -201,10 +197,6 @@ class SepLogin:
                 print(cookie_item)
                 self.cookie_dict[cookie_item['name']] = cookie_item['value']
             print(self.cookie_dict)
-            driver.quit()
-        except Exception as e:
-            driver.quit()
-            raise e
         return
 
     def get_exams(self, term_id=64758):
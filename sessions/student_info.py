@@ -1,23 +1,25 @@
-import csv, datetime, difflib, os
+import csv, datetime, difflib, os, threading
+from collections import Counter
 from .general import Session
 from ..responses import ResponseMsg
 from ..paths import PATHS
-from ..permissions import get_permissions
 
 
 INFO_TABLE = os.path.join(PATHS['data'], 'GNB_student_info.csv')
 TOTAL_TABLE = os.path.join(PATHS['data'], 'GNB_total_info.csv')
-PERM_LIST = get_permissions().get('InfoSession', {})
+_TABLES = {}  # 文件名 -> StudentTable
+_TABLES_LOCK = threading.Lock()
 
 
 class InfoSession(Session):
+    permissions_key = 'InfoSession'
+
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self._max_delta = 2*60
         self.session_type = '学生信息搜索'
         self.strict_commands = ['搜索', '查找', 'search']
         self.description = '从数据库中搜索学生信息'
-        self.permissions = PERM_LIST
         self.is_first_time = True
 
     def handle(self, request):
@@ -27,8 +29,8 @@ class InfoSession(Session):
         else:
             self.deactivate()
             name = request.msg
-            total_list = search_name(infolist=get_total_list(), name=name)
-            partial_list = search_name(infolist=get_info_list(), name=name)
+            total_list = get_total_table().search_name(name)
+            partial_list = get_info_table().search_name(name)
             # if matched in total (1 found) but not in partial (1+ found)
             if len(partial_list) > len(total_list):
                 student_list = total_list
@@ -55,7 +57,81 @@ def read_csv(filename):
     return result
 
 
+# 文件的(修改时间, 大小)，用于判断是否被改写
+def _file_stat(filename):
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# 读入内存的学生表，带按字的倒排索引（搜索姓名）和按(月, 日)的生日索引
+class StudentTable:
+    def __init__(self, rows, stat=None, name_tag='姓名', birth_date_tag='出生日期', split_symble='-'):
+        self.rows = rows
+        self.stat = stat
+        self._names = [row[name_tag] for row in rows]
+        self._chars = {}  # 字 -> [(行号, 该字在姓名中出现的次数)]
+        self._empty = []  # 姓名为空的行，包含于任何名字中
+        self._birthdays = {}  # (月, 日) -> 行号列表
+        for i, name in enumerate(self._names):
+            if not name:
+                self._empty.append(i)
+            for char, n in Counter(name).items():
+                self._chars.setdefault(char, []).append((i, n))
+            try:
+                birth_dates = rows[i][birth_date_tag].split(split_symble)
+                key = (int(birth_dates[1]), int(birth_dates[2]))
+            except (KeyError, AttributeError, IndexError, ValueError):
+                continue  # 没有生日或格式不对
+            self._birthdays.setdefault(key, []).append(i)
+
+    # 与cal_sim的结果相同：没有共同的字时相似度为0，只需比较索引中找到的行
+    # quick_ratio = 2 * 共同字数 / 总长度，共同字数直接由索引累加得到
+    def search_name(self, name: str) -> list:
+        if not name:
+            return list(self.rows)  # 空字符串包含于任何名字中
+        common = {}  # 行号 -> 共同字数
+        for char, n in Counter(name).items():
+            for i, m in self._chars.get(char, ()):
+                common[i] = common.get(i, 0) + min(n, m)
+        for i in self._empty:
+            common[i] = 0
+        student_list = []
+        max_sim = 0
+        for i in sorted(common.keys()):  # 保持表格中的顺序
+            row_name = self._names[i]
+            # 包含关系只可能在一方的字全部共有时出现
+            if common[i] in (len(name), len(row_name)) and (name in row_name or row_name in name):
+                sim = 1.0
+            else:
+                sim = 2.0 * common[i] / (len(name) + len(row_name))
+            if sim == 0:
+                continue
+            elif sim > max_sim:
+                max_sim = sim
+                student_list = [self.rows[i]]
+            elif sim == max_sim:
+                student_list.append(self.rows[i])
+        return student_list
+
+    def search_birth(self, name_tag='姓名', days_pre=2) -> list:
+        date = datetime.date.today() + datetime.timedelta(days=days_pre)
+        return ['%s(%2i-%2i)' % (self.rows[i][name_tag], date.month, date.day)
+                for i in self._birthdays.get((date.month, date.day), [])]
+
+
+# 每个表格只读入一次，文件改动后重新读入
+def load_table(filename) -> StudentTable:
+    stat = _file_stat(filename)
+    with _TABLES_LOCK:
+        table = _TABLES.get(filename)
+        if table is None or table.stat != stat:
+            table = _TABLES[filename] = StudentTable(read_csv(filename=filename), stat=stat)
+        return table
+
+
 def search_birth(info_list, birth_date_tag='出生日期', name_tag='姓名', split_symble='-', days_pre=2):
+    if isinstance(info_list, StudentTable):
+        return info_list.search_birth(name_tag=name_tag, days_pre=days_pre)
     date = datetime.date.today() + datetime.timedelta(days=days_pre)
     result_list = []
     for student in info_list:
@@ -65,15 +141,25 @@ def search_birth(info_list, birth_date_tag='出生日期', name_tag='姓名', sp
     return result_list
 
 
+def get_info_table(filename=INFO_TABLE) -> StudentTable:
+    return load_table(filename=filename)
+
+
+def get_total_table(filename=TOTAL_TABLE) -> StudentTable:
+    return load_table(filename=filename)
+
+
 def get_info_list(filename=INFO_TABLE):
-    return read_csv(filename=filename)
+    return get_info_table(filename=filename).rows
 
 
 def get_total_list(filename=TOTAL_TABLE):
-    return read_csv(filename=filename)
+    return get_total_table(filename=filename).rows
 
 
 def search_name(infolist, name: str, name_tag='姓名'):
+    if isinstance(infolist, StudentTable):
+        return infolist.search_name(name)
     student_list = []
     max_sim = 0
     for student in infolist:
@@ -46,6 +46,9 @@ class AutoQuitThread(threading.Thread):
 
 
 class SubNaocSession(Session):
+    _extend_p = 95
+    _strict_p = 95
+
     def __init__(self, user_id):
         Session.__init__(self, user_id=user_id)
         self._max_delta = 60
@@ -61,9 +64,6 @@ class SubNaocSession(Session):
         self._requests_session = None
         self._requests_checkkey = None  # in requests method
 
-    def probability_to_call(self, request):
-        return self._called_by_command(request=request, extend_p=95, strict_p=95)
-
     def handle(self, request):
         if self.is_first_time:
             self.is_first_time = False
@@ -2,17 +2,46 @@ from ..responses import ResponseMsg
 from .argument import ArgSession
 from ..paths import PATHS
 from ..external.record_table import RecordTable, RecordNotFoundError
-import os, datetime
+import os, datetime, threading
 
 # 2021-12-11: 完成代码并进行调试
 # 2021-12-11: 支持多条加入，另外加入了删除机制
 # 2022-06-13: 支持企业微信平台
+# 订阅表按(hour, minute)索引，常驻内存，每分钟只检查对应的条目
 
 SUBS_LIST = os.path.join(PATHS['data'], 'qq_subscription_list.xlsx')
 SUBS_LISTS = {'CQ': os.path.join(PATHS['data'], 'qq_subscription_list.xlsx'),
               'WCE': os.path.join(PATHS['data'], 'wce_subscription_list.xlsx')}
 
 
+# 进程内共用的订阅索引，订阅表被改写（本进程或其他进程）后重新建立
+class SubscriptionIndex:
+    def __init__(self):
+        self._buckets = {}  # (hour, minute) -> 订阅记录序列
+        self._stat = None  # 建立索引时订阅表的(修改时间, 大小)
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._stat = None
+
+    def get(self, table, hour, minute) -> list:
+        stat = table.stat()
+        if stat is None:  # 订阅列表不存在
+            return []
+        with self._lock:
+            if stat != self._stat:
+                buckets = {}
+                for i in table.get_dfl():
+                    buckets.setdefault((int(i['hour']), int(i['minute'])), []).append(i)
+                self._buckets = buckets
+                self._stat = table.stat()  # 读取时可能新建了数据库
+            return list(self._buckets.get((hour, minute), []))
+
+
+SUBS_INDEXES = {platform: SubscriptionIndex() for platform in SUBS_LISTS.keys()}
+
+
 # 给scheduler调用，用于查找订阅列表
 def get_qq_subscriptions(request, now=None):
     return SubscriptionRecords().get_subscriptions(request=request, now=now)
@@ -229,6 +258,10 @@ class SubscriptionRecords(RecordTable):
         if platform == 'QQ':
             platform = 'CQ'
         RecordTable.__init__(self, table_file=SUBS_LISTS[platform], string_cols=['user_id'])
+        self.index = SUBS_INDEXES[platform]
+
+    def _changed(self):
+        self.index.invalidate()
 
     @staticmethod
     def list_single_record(record) -> str:
@@ -240,9 +273,12 @@ class SubscriptionRecords(RecordTable):
         return msg
 
     def _append_no_repeat(self, record_list):
+        existing = self.find_all(user_id=record_list[0]['user_id']) if record_list else []  # 只需读取一次
+        new_records = []
         for i in record_list:
-            if i not in self.get_dfl():  # 每次都要检查
-                self.append_full(i)
+            if i not in existing and i not in new_records:
+                new_records.append(i)
+        self.append_all(new_records)
 
     def append(self, hour, msg, user_id, minute=0, dhour=0, temp=False, no_repeat=False, get_brief=False):
         # 整理、检测合法性
@@ -273,35 +309,25 @@ class SubscriptionRecords(RecordTable):
         if no_repeat:
             self._append_no_repeat(record_list=new_records)
         else:
-            for i in new_records:
-                self.append_full(item=i)
+            self.append_all(new_records)
 
         if get_brief:
             return f'{hour:02d}:{minute:02d} - {user_id}\n{msg}'
 
     def get_subscriptions(self, request, now=None):
-        # 如果订阅列表不存在
-        if not self.is_exist():
-            return []
-
         request_list = []  # 转化成的request
         expire_list = []  # 过期的临时项目
         if now is None:
             now = datetime.datetime.now()
 
-        for i in self.get_dfl():
-            if int(i['hour']) == now.hour and int(i['minute'] == now.minute):
-                new_r = request.new(msg=i['message'])
-                new_r.user_id = str(i['user_id'])
-                request_list.append(new_r)
-                if i['temp'] == 1:  # 临时项目
-                    expire_list.append(i)
+        for i in self.index.get(table=self, hour=now.hour, minute=now.minute):
+            new_r = request.new(msg=i['message'])
+            new_r.user_id = str(i['user_id'])
+            request_list.append(new_r)
+            if i['temp'] == 1:  # 临时项目
+                expire_list.append(i)
 
-        # 去除过期项目（temp项）
-        for i in expire_list:
-            try:
-                self.delete(record=i, from_new=False)
-            except RecordNotFoundError:
-                pass
+        # 去除过期项目（temp项），一次写入
+        self.delete_all(records=expire_list, from_new=False)
 
         return request_list
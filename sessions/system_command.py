@@ -1,10 +1,11 @@
 from .argument import ArgSession, Argument
 from ..responses import ResponseMsg
-from ..permissions import get_permissions
 import os
 
 
 class SystemCmdSession(ArgSession):
+    permissions_key = 'super'
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self.session_type = '系统命令'
@@ -16,7 +17,6 @@ class SystemCmdSession(ArgSession):
                                   ask_text='请输入要执行的命令',
                                   help_text='执行的命令')]
         self.default_arg = self.arg_list[0]
-        self.permissions = get_permissions().get('super', {})
 
     def internal_handle(self, request):
         self.deactivate()
@@ -11,6 +11,8 @@ ENGINE_TYPE = "16k_zh"
 
 
 class ActiveAudioSession(ArgSession):
+    _text_only = False  # 后续消息为语音
+
     def __init__(self, user_id):
         ArgSession.__init__(self, user_id=user_id)
         self._max_delta = 3*60
@@ -23,9 +25,6 @@ class ActiveAudioSession(ArgSession):
                                   ask_text='等待语音传输',
                                   help_text='接收语音参数，转为文字')]
 
-    def is_legal_request(self, request):
-        return True
-
     def internal_handle(self, request):
         self.deactivate()
         audio_file = self.arg_dict['audio'].raw_req.aud
@@ -2,12 +2,110 @@ from .argument import ArgSession
 from ..responses import ResponseMsg, ResponseImg
 from ..api_tokens import CAIYUN_API_TOKEN, BAIDU_MAP_API_TOKEN
 from ..utils import image_filename
-import requests, urllib, datetime, math, re, threading, time, traceback, random
-import matplotlib.pyplot as plt
+from ..paths import PATHS
+from ..external.ttl_cache import TTLCache
+from ..render_service import render
+from ..figures import draw_temperature, draw_t_a, draw_winds, draw_hourly, draw_general, draw_p2h, draw_wind_map
+import requests, urllib, datetime, math, re, threading, time, traceback, os, json, sqlite3
+import concurrent.futures
 import numpy as np
 from PIL import Image
 from io import BytesIO
 
+# 彩云天气的返回结果在进程内共用，经纬度取整后作为key，不同插件、订阅和风向图的格点可以共用同一次请求
+CAIYUN_COORD_DIGITS = 3  # 经纬度保留的小数位数（约100m）
+CAIYUN_TTL = 10 * 60  # 彩云接口结果的缓存时间（秒），综合接口包含实时天气
+CAIYUN_CACHE = TTLCache(max_size=1024, ttl=CAIYUN_TTL)
+CAIYUN_MAX_RATE = 10  # 每秒最多请求次数
+WIND_MAP_WORKERS = 8  # 风向图并行请求格点数据的线程数
+
+
+# 限制请求频率，两次请求之间至少间隔1/rate秒
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+CAIYUN_LIMITER = RateLimiter(rate=CAIYUN_MAX_RATE)
+WIND_MAP_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=WIND_MAP_WORKERS,
+                                                          thread_name_prefix='WindMap')
+
+
+def _caiyun_get(url):
+    CAIYUN_LIMITER.wait()
+    return requests.get(url=url).json()
+
+
+# 百度地图的地理编码结果几乎不变，保存在硬盘上，内存中再缓存最近使用的
+GEOCODE_CACHE_FILE = os.path.join(PATHS['cache'], 'geocode_cache.sqlite3')
+GEOCODE_TTL = 180 * 24 * 3600  # 秒
+GEOCODE_REVERSE_DIGITS = 3  # 逆地理编码时经纬度保留的小数位数（约100m）
+
+
+class GeocodeCache:
+    def __init__(self, db_file, ttl=GEOCODE_TTL, memory_size=1024):
+        self.db_file = db_file
+        self.ttl = ttl
+        self._memory = TTLCache(max_size=memory_size, ttl=ttl)
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        if not self._ready:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, value TEXT NOT NULL, time REAL NOT NULL)')
+            self._ready = True
+        return conn
+
+    def _db_get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT value, time FROM geocode WHERE key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def _db_set(self, key, value):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO geocode (key, value, time) VALUES (?, ?, ?)',
+                             (key, json.dumps(value, ensure_ascii=False), time.time()))
+        finally:
+            conn.close()
+
+    # 依次查找内存、硬盘，都没有时调用loader（出错时不缓存）
+    def get_or_load(self, key, loader):
+        def load():
+            try:
+                value = self._db_get(key)
+            except sqlite3.Error:  # 缓存文件出错时直接请求
+                traceback.print_exc()
+                value = None
+            if value is None:
+                value = loader()
+                try:
+                    self._db_set(key, value)
+                except sqlite3.Error:
+                    traceback.print_exc()
+            return value
+        return self._memory.get_or_load(key=key, loader=load)
+
+
+GEOCODE_CACHE = GeocodeCache(GEOCODE_CACHE_FILE)
+
 
 class WeatherSession(ArgSession):
     def __init__(self, user_id):
@@ -137,7 +235,7 @@ class WindMapSession(ArgSession):
         self.default_arg = self.arg_list[0]  # location
         self.detail_description = '获取高可自定义性的风力分布图（默认为实时）；' \
                                   '风矢中长划线表示10节（5.14m/s），短划线表示5节（2.57m/s），' \
-                                  '点数过多时会随机舍弃部分数据点。\n' \
+                                  '点数过多时会按间隔均匀舍弃部分数据点。\n' \
                                   '例如，“风向 北京市 -d 1 -hr 6 -len 60 -dl 5 -fs 20”。'
 
     def is_legal_request(self, request):
@@ -174,16 +272,23 @@ class WeatherAPI:
         self.latitude = latitude  # 纬度
         self.resp_dict = None
 
-    def general_url(self):
+    def general_url(self, endpoint='weather'):
         return f'https://api.caiyunapp.com/v2.5/{CAIYUN_API_TOKEN}/' \
-               f'{self.longitude:.4f},{self.latitude:.4f}/weather.json'
+               f'{self.longitude:.{CAIYUN_COORD_DIGITS}f},{self.latitude:.{CAIYUN_COORD_DIGITS}f}/{endpoint}.json'
+
+    def _cache_key(self, endpoint='weather'):
+        return endpoint, round(self.longitude, CAIYUN_COORD_DIGITS), round(self.latitude, CAIYUN_COORD_DIGITS)
 
-    def get_resp(self, url=None):
+    # 先查进程内缓存，同一地点同时只请求一次；指定url时不使用缓存
+    def get_resp(self, url=None, endpoint='weather'):
         if self.resp_dict is None:
-            if url is None:
-                url = self.general_url()
-            resp = requests.get(url=url)
-            self.resp_dict = resp.json()
+            if url is not None:
+                self.resp_dict = _caiyun_get(url=url)
+            else:
+                url = self.general_url(endpoint=endpoint)
+                self.resp_dict = CAIYUN_CACHE.get_or_load(key=self._cache_key(endpoint=endpoint),
+                                                          loader=lambda: _caiyun_get(url=url),
+                                                          should_cache=lambda r: r.get('status') == 'ok')
         return self.resp_dict
 
     def set_location_from_string(self, location_string):
@@ -208,23 +313,32 @@ class WeatherAPI:
         self.set_city(city_name=location_string)
 
     def set_city(self, city_name):
-        resp = requests.get('http://api.map.baidu.com/geocoding/v3/?address=%s&output=json&ak=%s'
-                            % (urllib.request.quote(city_name), BAIDU_MAP_API_TOKEN))
-        loc = resp.json()['result']['location']
+        def geocode():
+            resp = requests.get('http://api.map.baidu.com/geocoding/v3/?address=%s&output=json&ak=%s'
+                                % (urllib.request.quote(city_name), BAIDU_MAP_API_TOKEN))
+            location = resp.json()['result']['location']
+            return {'lng': location['lng'], 'lat': location['lat']}
+
+        key = 'forward:' + ' '.join(city_name.split()).lower()
+        loc = GEOCODE_CACHE.get_or_load(key=key, loader=geocode)
         self.longitude, self.latitude = loc['lng'], loc['lat']
         self.resp_dict = None
 
     def get_city(self):
-        resp = requests.get(f'http://api.map.baidu.com/reverse_geocoding/v3/?ak={BAIDU_MAP_API_TOKEN}'
-                            f'&output=json&coordtype=wgs84ll&location={self.latitude},{self.longitude}')
-        # loc = resp.json()['result']['addressComponent']
-        # return f"{loc['country']}{loc['province']}{loc['city']}{loc['district']}{loc['town']}[{loc['adcode']}]"
-        # return f"{loc['city']}{loc['district']}{loc['town']}({loc['adcode']})"
-        return f"{resp.json()['result']['formatted_address']}" \
-               f"[{resp.json()['result']['addressComponent']['adcode']}]"
+        def reverse_geocode():
+            resp = requests.get(f'http://api.map.baidu.com/reverse_geocoding/v3/?ak={BAIDU_MAP_API_TOKEN}'
+                                f'&output=json&coordtype=wgs84ll&location={self.latitude},{self.longitude}')
+            result = resp.json()['result']
+            # loc = result['addressComponent']
+            # return f"{loc['country']}{loc['province']}{loc['city']}{loc['district']}{loc['town']}[{loc['adcode']}]"
+            # return f"{loc['city']}{loc['district']}{loc['town']}({loc['adcode']})"
+            return f"{result['formatted_address']}[{result['addressComponent']['adcode']}]"
+
+        key = f'reverse:{self.longitude:.{GEOCODE_REVERSE_DIGITS}f},{self.latitude:.{GEOCODE_REVERSE_DIGITS}f}'
+        return GEOCODE_CACHE.get_or_load(key=key, loader=reverse_geocode)
 
     def realtime_report(self):
-        results = self.get_resp(url=self.general_url())
+        results = self.get_resp()
         rdict = results['result']['realtime']
 
         realtime_string = f"温度[{rdict['temperature']:.2f} ℃]，相对湿度[{100 * rdict['humidity']:.0f}%]\n" \
@@ -269,7 +383,7 @@ class WeatherAPI:
     def delta_day_data(self, path_to_data=['result', 'hourly', 'temperature'],
                        path_to_datetime=['datetime'], path_to_value=['value'],
                        delta_days=1):
-        results = self._locate_from_path(source_dict=self.get_resp(url=self.general_url()),
+        results = self._locate_from_path(source_dict=self.get_resp(),
                                          path_list=path_to_data)
         target_date = datetime.date.today() + datetime.timedelta(days=delta_days)
         hour_list = []
@@ -297,72 +411,22 @@ class WeatherAPI:
 
     @staticmethod
     def plot_temperature(hour_list, temp_list, date, filename):
-        fig, ax = plt.subplots(figsize=(4, 3))
-        ax.plot(hour_list, temp_list)
-        ax.set_xlabel('Hour')
-        ax.set_ylabel('Temperature[℃]')
-        ax.set_title('Hourly Temperature [%s]' % date)
-        ax.grid()
-        fig.tight_layout()
-        fig.savefig(filename)
-
-    @staticmethod
-    def _next_day_plotter(ax: plt.Axes, data_dict, label: str, plot_kwargs={}):
-        ln = ax.plot(data_dict['hour'], data_dict['value'], label=label, **plot_kwargs)
-        ax.set_xlim(min(data_dict['hour']), max(data_dict['hour']))
-        return ln
-
-    @staticmethod
-    def _wind_plotter(ax: plt.Axes, data_dict):
-        t = np.array(data_dict['hour'])
-        s = np.array(data_dict['speed'])
-        d = np.array(data_dict['direction']) * math.pi / 180
-        u = -s * np.sin(d) / 1.852
-        v = -s * np.cos(d) / 1.852
-        ax.plot(t, s / 3.6)
-        ax.barbs(t, s / 3.6, u, v, pivot='middle')
+        render(draw_temperature, filename=filename, figsize=(4, 3),
+               hour_list=hour_list, temp_list=temp_list, date=date)
 
     def auto_plot_t_a(self, filename):
         t = self.next_day_data(path_to_data=['result', 'hourly', 'temperature'], path_to_value=['value'])
         a = self.next_day_data(path_to_data=['result', 'hourly', 'air_quality', 'aqi'], path_to_value=['value', 'chn'])
-        fig, ax1 = plt.subplots(figsize=(4, 3))
-        ln1 = self._next_day_plotter(ax1, t, label='Temperature')
-        ax1.set_ylim(-5, 30)
-        ax1.set_xlabel('Time [H]')
-        ax1.set_ylabel('Temperature [℃]')
-        ax1.set_title('Weather [%s]' % a['date'])
-        ax1.grid()
-        ax2 = ax1.twinx()
-        ln2 = self._next_day_plotter(ax2, a, label='AQI', plot_kwargs={'color': 'orange'})
-        ax2.set_ylim(0, 500)
-        ax2.set_ylabel('Air Quality Index')
-        lns = ln1 + ln2
-        labs = [l.get_label() for l in lns]
-        ax1.legend(lns, labs)
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_t_a, filename=filename, figsize=(4, 3), t=t, a=a)
 
     def auto_plot_winds(self, filename, delta_days=1):
         w = self.delta_day_wind(delta_days=delta_days)
-        fig, ax = plt.subplots(figsize=(4, 3))
-        self._wind_plotter(ax, w)
-        ax.set_xlabel('Time [h]')
-        ax.set_ylabel('Wind Speed [m/s]')
-        ax.set_title('Wind Forcast [%s]' % w['date'])
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_winds, filename=filename, figsize=(4, 3), w=w)
 
     def auto_plot_hourly(self, filename, delta_days, path_to_data,
                          ylabel, title):
         data = self.delta_day_data(path_to_data=path_to_data, delta_days=delta_days)
-        fig, ax = plt.subplots(figsize=(4, 3))
-        self._next_day_plotter(ax=ax, data_dict=data, label='')
-        ax.set_xlabel('Hour')
-        ax.set_ylabel(ylabel)
-        ax.set_title(f'{title} [{data["date"]}]')
-        ax.grid()
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_hourly, filename=filename, figsize=(4, 3), data=data, ylabel=ylabel, title=title)
 
     def auto_plot_uv(self, filename, delta_days=1):
         self.auto_plot_hourly(filename=filename, delta_days=delta_days,
@@ -377,109 +441,28 @@ class WeatherAPI:
                               title='Hourly Air Pressure')
 
     def auto_plot_general(self, filename, delta_days=1):
-        temp = self.delta_day_data(path_to_data=['result', 'hourly', 'temperature'], delta_days=delta_days)
-        aqi = self.delta_day_data(path_to_data=['result', 'hourly', 'air_quality', 'aqi'],
-                                  path_to_value=['value', 'chn'], delta_days=delta_days)
-        pm25 = self.delta_day_data(path_to_data=['result', 'hourly', 'air_quality', 'pm25'], delta_days=delta_days)
-        dswrf = self.delta_day_data(path_to_data=['result', 'hourly', 'dswrf'], delta_days=delta_days)
-        visibility = self.delta_day_data(path_to_data=['result', 'hourly', 'visibility'], delta_days=delta_days)
-        cloudrate = self.delta_day_data(path_to_data=['result', 'hourly', 'cloudrate'], delta_days=delta_days)
-        pressure = self.delta_day_data(path_to_data=['result', 'hourly', 'pressure'], delta_days=delta_days)
-        skycon = self.delta_day_data(path_to_data=['result', 'hourly', 'skycon'], delta_days=delta_days)
-        humidity = self.delta_day_data(path_to_data=['result', 'hourly', 'humidity'], delta_days=delta_days)
-        precipitation = self.delta_day_data(path_to_data=['result', 'hourly', 'precipitation'], delta_days=delta_days)
-
-        fig, axs = plt.subplots(nrows=4, ncols=1, figsize=(4, 8), sharex=True)
-
-        # First axis Temperature & Precipitation
-        ln0a = self._next_day_plotter(axs[0], temp, label='Temperature', plot_kwargs={'color': 'orangered'})
-
-        # preset temperature limits
-        ymin_set = -10
-        ymax_set = 20
-        # move up
-        while np.max(temp['value']) > ymax_set:
-            ymax_set += 10
-            ymin_set += 10
-        # move down
-        while np.min(temp['value']) < ymin_set:
-            ymin_set -= 10
-            ymax_set -= 10
-        # adjust delta
-        while np.max(temp['value']) > ymax_set:
-            ymax_set += 10
-
-        axs[0].set_ylim(ymin_set, ymax_set)
-        axs[0].set_ylabel('Temperature [℃]')
-        axs[0].set_title('Weather [%s]' % temp['date'])
-        axs[0].grid()
-        ax0b = axs[0].twinx()
-        ln0b = self._next_day_plotter(ax0b, precipitation, label='Precipitation', plot_kwargs={'color': 'royalblue'})
-        ax0b.set_ylabel('Precipitation [mm/h]')
-        ax0b.set_ylim(0.1, 100)
-        ax0b.set_yscale('log')
-        ln0s = ln0a + ln0b
-        lab0s = [l.get_label() for l in ln0s]
-        axs[0].legend(ln0s, lab0s)
-
-        # Second axis AQI, pm25 & visibility
-        ln1a0 = self._next_day_plotter(axs[1], aqi, label='AQI', plot_kwargs={'color': 'darkgreen'})
-        ln1a1 = self._next_day_plotter(axs[1], pm25, label='PM2.5', plot_kwargs={'color': 'olive'})
-        axs[1].set_ylim(1, 1000)
-        axs[1].set_ylabel('Air Quality')
-        axs[1].set_yscale('log')
-        axs[1].grid()
-        ax1b = axs[1].twinx()
-        ln1b = self._next_day_plotter(ax1b, visibility, label='Visibility', plot_kwargs={'color': 'purple'})
-        ax1b.set_ylabel('Visibility [km]')
-        ax1b.set_ylim(0, 30)
-        ln1s = ln1a0 + ln1a1 + ln1b
-        lab1s = [l.get_label() for l in ln1s]
-        axs[1].legend(ln1s, lab1s)
-
-        # Third axis cloudrate & humidity
-        ln2a = self._next_day_plotter(axs[2], cloudrate, label='Cloudrate', plot_kwargs={'color': 'deepskyblue'})
-        axs[2].set_ylim(0, 1.05)
-        axs[2].set_ylabel('Cloudrate [%]')
-        axs[2].grid()
-        ax2b = axs[2].twinx()
-        ln2b = self._next_day_plotter(ax2b, humidity, label='Humidity', plot_kwargs={'color': 'springgreen'})
-        ax2b.set_ylabel('Humidity [%]')
-        ax2b.set_ylim(0, 1.05)
-        ln2s = ln2a + ln2b
-        lab2s = [l.get_label() for l in ln2s]
-        axs[2].legend(ln2s, lab2s)
-
-        # Forth axis Wind
-        wind = self.delta_day_wind(delta_days=delta_days)
-        self._wind_plotter(axs[3], wind)
-        axs[3].set_ylabel('Wind Speed [m/s]')
-        axs[3].set_xlabel('Time [H]')
-        axs[3].set_ylim(0, 13)
-
-        fig.tight_layout()
-        fig.savefig(filename)
+        data = {}
+        for key, path_to_data, path_to_value in [('temp', ['temperature'], ['value']),
+                                                 ('aqi', ['air_quality', 'aqi'], ['value', 'chn']),
+                                                 ('pm25', ['air_quality', 'pm25'], ['value']),
+                                                 ('visibility', ['visibility'], ['value']),
+                                                 ('cloudrate', ['cloudrate'], ['value']),
+                                                 ('humidity', ['humidity'], ['value']),
+                                                 ('precipitation', ['precipitation'], ['value'])]:
+            data[key] = self.delta_day_data(path_to_data=['result', 'hourly'] + path_to_data,
+                                            path_to_value=path_to_value, delta_days=delta_days)
+        data['wind'] = self.delta_day_wind(delta_days=delta_days)
+        render(draw_general, filename=filename, figsize=(4, 8), **data)
 
     def auto_plot_p2h(self, filename):
         # get 2h precipitation list of 120 elements
-        p = self._locate_from_path(source_dict=self.get_resp(url=self.general_url()),
+        p = self._locate_from_path(source_dict=self.get_resp(),
                                    path_list=['result', 'minutely', 'precipitation_2h'])
-        # plot figure
-        fig, ax = plt.subplots(figsize=(4, 3))
-        t = np.arange(120) + 1
-        ax.plot(t, p, color='royalblue')
-        ax.set_xlabel('Time [min]')
-        ax.set_ylabel('Precipitation [mm/h]')
-        ax.set_ylim(0.1, 100)
-        ax.set_yscale('log')
-        ax.set_title('Precipitation forcast in 2 hours')
-        ax.set_xlim(1, 120)
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_p2h, filename=filename, figsize=(4, 3), p=p)
 
     def auto_plot_wind_map(self, length_km, delta_km, filename, delta_days=1, hour=12, figsize=8., max_points=100):
         # overlay wind map on BaiduMap
-        # optimized with threading
+        # 格点数据由线程池并行请求（限制频率，并共用缓存）
 
         earth_radius = 6378  # constant, km
         center_x = self.longitude
@@ -508,63 +491,30 @@ class WeatherAPI:
         nx = xx.shape[0]
         ny = yy.shape[0]
 
-        # 当总点数超出最高点数后，以一定概率抛弃该点，防止过度访问
-        probability = max_points/(nx*ny)
-
-        # intialize array of WeatherApi objects
-        wapi_array = []
-        for x in xx:
-            wapi_list = []
-            for y in yy:
-                wapi_list.append(WeatherAPI(x, y))
-            wapi_array.append(wapi_list)
-
-        # initialize threads
-        thread_array = []
-        for i in range(nx):
-            thread_list = []
-            for j in range(ny):
-                thread_list.append(WapiThread(wapi=wapi_array[i][j], delta_days=delta_days))
-                if random.random() > probability:
-                    # 以一定概率（1-p）抛弃此数据点
-                    thread_list[-1].fail_reason = 'abandoned'
-                else:
-                    thread_list[-1].start()
-            thread_array.append(thread_list)
+        # 当总点数超出最高点数后，按相同间隔均匀选取格点（居中），防止过度访问
+        stride = 1
+        while math.ceil(nx / stride) * math.ceil(ny / stride) > max_points:
+            stride += 1
+        selected = [(i, j) for i in range((nx - 1) % stride // 2, nx, stride)
+                    for j in range((ny - 1) % stride // 2, ny, stride)]
 
-        # wait until completion
-        while True:
-            time.sleep(0.1)
-            still_alive = False
-            for i in range(nx):
-                for j in range(ny):
-                    if thread_array[i][j].is_alive():
-                        still_alive = True
-                        break
-            if still_alive:
-                # pipeline not finished
-                continue
-            else:
-                break
+        # 提交到线程池，等待全部完成
+        futures = {(i, j): WIND_MAP_EXECUTOR.submit(_fetch_wind, wapi=WeatherAPI(xx[i], yy[j]), delta_days=delta_days)
+                   for i, j in selected}
+        concurrent.futures.wait(futures.values())
 
         # fill wind arrays
-        wind_array = []
-        for i in range(nx):
-            wind_list = []
-            for j in range(ny):
-                wind_list.append(thread_array[i][j].wind)
-            wind_array.append(wind_list)
-
+        wind_array = [[None] * ny for _ in range(nx)]
         n_unexpected_errors = 0
-
-        # check errors
-        for i in range(nx):
-            for j in range(ny):
-                if wind_array[i][j] is None:
-                    if thread_array[i][j].unexpected_error:
-                        n_unexpected_errors += 1
-                        print(f'error in {i},{j}')
-                        print(thread_array[i][j].fail_reason)
+        for (i, j), future in futures.items():
+            try:
+                wind_array[i][j] = future.result()
+            except Exception:
+                # if unexpected error happened or max retries reached
+                n_unexpected_errors += 1
+                print(f'error in {i},{j}')
+                print(''.join(traceback.format_exception(type(future.exception()), future.exception(),
+                                                         future.exception().__traceback__)))
 
         img = Image.open(BytesIO(requests.get(map_img_url).content))
 
@@ -600,18 +550,6 @@ class WeatherAPI:
                     slist.append(wind_array[i][j]['speed'][h_index])
                     dlist.append(wind_array[i][j]['direction'][h_index])
 
-        fig, ax = plt.subplots(figsize=(figsize, figsize))
-        s = np.array(slist)
-        d = np.array(dlist) * math.pi / 180
-        u = -s * np.sin(d) / 1.852
-        v = -s * np.cos(d) / 1.852
-
-        ax.barbs(xlist, ylist, u, v, pivot='middle')
-        ax.imshow(img, extent=(xx[0] - delta_deg / 2, xx[-1] + delta_deg / 2,
-                               yy[0] - delta_deg / 2, yy[-1] + delta_deg / 2))
-        ax.set_xlabel('Longitude [deg]')
-        ax.set_ylabel('Latitude [deg]')
-
         # set title
         title = f'Wind Map {hour:02d}:00'
         if len(xlist) != (nx*ny):
@@ -620,45 +558,25 @@ class WeatherAPI:
                 title += f' with {n_unexpected_errors} errors'
             title += ')'
 
-        ax.set_title(title)
-        fig.tight_layout()
-        fig.savefig(filename)
+        render(draw_wind_map, filename=filename, figsize=(figsize, figsize),
+               img=np.asarray(img), xlist=xlist, ylist=ylist, slist=slist, dlist=dlist,
+               extent=(xx[0] - delta_deg / 2, xx[-1] + delta_deg / 2,
+                       yy[0] - delta_deg / 2, yy[-1] + delta_deg / 2),
+               title=title)
 
     def test(self):
         self.auto_plot_general('test_general.png')
 
 
-# optimize with threadings
-class WapiThread(threading.Thread):
-    def __init__(self, wapi, delta_days):
-        threading.Thread.__init__(self)
-        self.wapi = wapi
-        self.delta_days = delta_days
-        self.wind = None
-        self.success = False
-        self.unexpected_error = False
-        self.fail_reason = ''
-
-    def run(self):
+# 在线程池中请求一个格点的风力数据，连接失败时重试
+def _fetch_wind(wapi, delta_days, max_connection_retries=3):
+    retries = 0
+    while True:
         try:
-            max_connection_retries = 3
-            retries = 0
-            while not self.success:
-                try:
-                    wind = self.wapi.delta_day_wind(delta_days=self.delta_days)
-                    self.wind = wind
-                    self.success = True
-                except requests.exceptions.ConnectionError as e:
-                    # if failed by connection error, wait and restart
-                    retries += 1
-                    if retries <= max_connection_retries:
-                        time.sleep(0.1)
-                        # goes back to the while loop
-                    else:
-                        raise e
-                        # raise the error to previous try (next line)
-        except Exception:
-            # if unexpected error happened or max retries reached
-            self.unexpected_error = True
-            self.fail_reason = traceback.format_exc()
-
+            return wapi.delta_day_wind(delta_days=delta_days)
+        except requests.exceptions.ConnectionError:
+            # if failed by connection error, wait and restart
+            retries += 1
+            if retries > max_connection_retries:
+                raise
+            time.sleep(0.1)
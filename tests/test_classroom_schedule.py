@@ -0,0 +1,115 @@
+# 教室查询缓存更新的测试：在本地用http.server模拟教务系统的查询页和结果页，通过共用浏览器池并行爬取
+import datetime, os, threading, urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+classroom_schedule = pytest.importorskip('MultiBot.sessions.classroom_schedule')
+webdriver_pool = pytest.importorskip('MultiBot.webdriver_pool')
+from MultiBot.paths import PATHS
+
+DAY_START, DAY_FINISH = 0, 2
+CAMPUS_IDS = [1, 2, 3]
+# 每个校区的教室：教室名 -> 有课的节次（0-11，0-3上午，4-7下午，8-11晚上）
+FIXTURE_ROOMS = {
+    '教一楼101': [],
+    '教一楼102': [1],
+    '教一楼103': [5, 9],
+    '教二楼201': [10],
+    '体育运动场': [],  # 不是教室，FreeRoomIndex中应被筛掉
+}
+
+
+# 课程名带上查询参数，用于检查每个(日期, 校区)拿到的是自己的结果
+def course_title(yq, weekname, weekday_name, slot):
+    return f'课程{yq}-{weekname}-{weekday_name}-{slot}'
+
+
+def query_page(max_week):
+    radios = ''.join(f'<input type="radio" name="yq" value="{i}">' for i in CAMPUS_IDS)
+    radios += ''.join(f'<input type="radio" name="weekname" value="{i}">' for i in range(1, max_week + 1))
+    radios += ''.join(f'<input type="radio" name="weekday_name" value="{code}">'
+                      for code in ['001', '010', '011', '100', '101', '110', '111'])
+    return (f'<html><body><form method="post" action="allclassroomforquery.asp">{radios}'
+            f'<input type="submit" name="Submit" value="查询"></form></body></html>')
+
+
+def result_page(yq, weekname, weekday_name):
+    rows = ''
+    for classroom, busy in FIXTURE_ROOMS.items():
+        cells = ''.join(f'<td><img src="c.gif" title="{course_title(yq, weekname, weekday_name, slot)}"></td>'
+                        if slot in busy else '<td></td>' for slot in range(12))
+        rows += f'<tr>\n<td>{classroom}</td>\n{cells}\n</tr>\n'
+    header = '<tr bgcolor="#EDD1F8"><td>教室</td>' + '<td>节次</td>' * 12 + '</tr>'
+    return f'<html><body><table>\n{header}\n{rows}</table></body></html>'
+
+
+@pytest.fixture
+def fixture_server():
+    first_day = classroom_schedule.ScheduleFinder().first_day
+    max_week = (datetime.date.today() + datetime.timedelta(days=DAY_FINISH) - first_day).days // 7 + 1
+    queries = []  # 收到的查询（yq, weekname, weekday_name）
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, html):
+            body = html.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send(query_page(max_week))
+
+        def do_POST(self):
+            form = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+            query = (form['yq'][0], form['weekname'][0], form['weekday_name'][0])
+            queries.append(query)
+            self._send(result_page(*query))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/allclassroomforquery0.asp?term=%s', queries
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.skipif(not os.path.exists(PATHS['webdriver']), reason='需要Chrome webdriver')
+def test_classroom_cache_update(fixture_server, tmp_path, monkeypatch):
+    url, queries = fixture_server
+    pool = webdriver_pool.DriverPool(max_drivers=2)
+    store = classroom_schedule.ClassroomStore(store_file=str(tmp_path / 'classroom_schedules.data'))
+    monkeypatch.setattr(classroom_schedule, 'CLASSROOM_QUERY_URL', url)
+    monkeypatch.setattr(classroom_schedule, 'DRIVER_POOL', pool)
+    monkeypatch.setattr(classroom_schedule, 'CLASSROOM_STORE', store)
+    try:
+        classroom_schedule.classroom_cache_update(day_start=DAY_START, day_finish=DAY_FINISH)
+        assert pool._n_drivers <= pool.max_drivers  # 浏览器被反复使用，没有为每个查询启动一个
+    finally:
+        pool.close()
+
+    n_days = DAY_FINISH - DAY_START + 1
+    assert len(queries) == n_days * len(CAMPUS_IDS)
+    for day_delta in range(DAY_START, DAY_FINISH + 1):
+        target = datetime.date.today() + datetime.timedelta(days=day_delta)
+        for campus_id in CAMPUS_IDS:
+            calender = classroom_schedule.ScheduleFinder(target=target, campus_id=campus_id).calender
+            query = (str(campus_id), calender['weekname'], calender['weekday_name'])
+            schedule_list = store.get(target_date=target, campus_id=campus_id)
+            assert [s['classroom'] for s in schedule_list] == list(FIXTURE_ROOMS.keys())
+            for schedule in schedule_list:
+                busy = FIXTURE_ROOMS[schedule['classroom']]
+                assert schedule['course_list'] == [course_title(*query, slot) if slot in busy else None
+                                                   for slot in range(12)]
+
+            index = store.get_index(target_date=target, campus_id=campus_id)
+            assert index.get('教一楼') == {'morning': ['101', '103'], 'afternoon': ['101', '102'],
+                                         'evening': ['101', '102'], 'allday': ['101']}
+            assert index.get('教二楼') == {'morning': ['201'], 'afternoon': ['201'],
+                                         'evening': [], 'allday': []}
+            assert '体育运动场' not in index.get('')['allday']
+            assert index.get('')['allday'] == ['教一楼101']
@@ -0,0 +1,172 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from .paths import PATHS
+import threading, contextlib, atexit, time, traceback
+
+MAX_DRIVERS = 3  # 同时存在的浏览器数量上限
+MAX_USES = 50  # 每个浏览器最多使用次数，之后关闭并重新启动，防止内存泄漏
+MAX_IDLE = 30 * 60  # 空闲超过该时间（秒）的浏览器会被关闭
+SWEEP_INTERVAL = 60  # 检查空闲浏览器的间隔（秒）
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.last_used = time.time()
+
+
+# 共用的无头浏览器（selenium webdriver），启动后反复使用，避免每次爬取都重新启动Chrome
+class DriverPool:
+    def __init__(self, max_drivers=MAX_DRIVERS, executable_path=PATHS['webdriver'],
+                 max_uses=MAX_USES, max_idle=MAX_IDLE):
+        self.max_drivers = max_drivers
+        self.executable_path = executable_path
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self._idle = []  # 空闲的浏览器
+        self._leased = {}  # id(driver) -> _PooledDriver，借出的浏览器
+        self._n_drivers = 0  # 已启动（包括借出）的浏览器数量
+        self._cond = threading.Condition()
+        self._sweeper = None  # 定期关闭空闲过久的浏览器的线程，第一次归还浏览器时启动
+
+    def _new_driver(self):
+        chrome_options = Options()
+        chrome_options.add_argument('--headless')
+        return webdriver.Chrome(chrome_options=chrome_options, executable_path=self.executable_path)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url  # 浏览器已退出或崩溃时会报错
+            return True
+        except Exception:
+            return False
+
+    # 取出空闲超过max_idle的浏览器，需持有self._cond
+    def _pop_stale(self):
+        stale = []
+        now = time.time()
+        while self._idle and now - self._idle[0].last_used > self.max_idle:  # 最早归还的在前
+            stale.append(self._idle.pop(0))
+            self._n_drivers -= 1
+        if stale:
+            self._cond.notify_all()
+        return stale
+
+    # 关闭空闲过久的浏览器，由定期检查的线程调用
+    def sweep(self):
+        with self._cond:
+            stale = self._pop_stale()
+        for p in stale:
+            self._quit(p.driver)
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception:
+                traceback.print_exc()
+
+    # 借出一个浏览器，达到上限时等待其他线程归还
+    def acquire(self):
+        while True:
+            pooled = None
+            with self._cond:
+                while not self._idle and self._n_drivers >= self.max_drivers:
+                    self._cond.wait()
+                stale = self._pop_stale()
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._n_drivers += 1
+            for p in stale:
+                self._quit(p.driver)
+            if pooled is None:
+                try:
+                    pooled = _PooledDriver(self._new_driver())
+                except BaseException:
+                    self._discard()
+                    raise
+            elif not self._is_healthy(pooled.driver):
+                self._quit(pooled.driver)
+                self._discard()
+                continue
+            pooled.uses += 1
+            with self._cond:
+                self._leased[id(pooled.driver)] = pooled
+            return pooled.driver
+
+    def _discard(self):
+        with self._cond:
+            self._n_drivers -= 1
+            self._cond.notify()
+
+    # 归还浏览器；discard为True（使用中出错、或页面状态不能给其他插件用）时关闭它
+    def release(self, driver, discard=False):
+        with self._cond:
+            pooled = self._leased.pop(id(driver))
+        if not discard and pooled.uses < self.max_uses:
+            try:  # 清理上一个插件留下的状态（等待时间、本地存储、cookie、页面）
+                driver.implicitly_wait(0)
+                try:
+                    driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+                except Exception:
+                    pass  # 部分页面（如about:blank）不能访问本地存储
+                driver.delete_all_cookies()  # 只删除当前页面域名的cookie
+                try:
+                    driver.execute_cdp_cmd('Network.clearBrowserCookies', {})  # Chrome中删除所有域名的cookie
+                except Exception:
+                    pass
+                driver.get('about:blank')
+            except Exception:
+                discard = True
+        else:
+            discard = True
+        if discard:
+            self._quit(driver)
+            self._discard()
+        else:
+            pooled.last_used = time.time()
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True,
+                                                     name='DriverPoolSweeper')
+                    self._sweeper.start()
+
+    @contextlib.contextmanager
+    def lease(self, discard=False):
+        """
+        :param discard: 用完后关闭浏览器，用于会留下登录状态（cookie）的插件
+        """
+        driver = self.acquire()
+        try:
+            yield driver
+        except BaseException:
+            self.release(driver, discard=True)
+            raise
+        else:
+            self.release(driver, discard=discard)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            traceback.print_exc()
+
+    # 关闭所有空闲的浏览器
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._n_drivers -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._quit(pooled.driver)
+
+
+DRIVER_POOL = DriverPool()
+atexit.register(DRIVER_POOL.close)